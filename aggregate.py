@@ -0,0 +1,158 @@
+#Copyright 2014, 2015 Carolina Feher da Silva
+#
+#This file is part of rtexp.
+#
+#rtexp is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#rtexp is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
+
+# Extracts the results of the motor model experiments from the checkpoint
+# files into a table, cached in the experiment directory
+
+import os, configparser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import ga
+
+CACHE_FILE = 'table.npz'
+
+# Table columns, one row per individual, then one row per checkpoint with
+# the genes of its best individual
+COLUMNS = ('run', 'g', 'pop', 'fitness', 'rt_valid', 'rt_neutral', 'rt_invalid',
+           'count', 'skipped_trials')
+BEST_COLUMNS = ('best_run', 'best_g', 'best_genes')
+
+def read_config(filename):
+    config = configparser.ConfigParser()
+    config.read(filename)
+    return config['EXP']
+
+def checkpoint_files(config, partial = False):
+    # Returns (run, g, filename) for the checkpoints of each generation saved,
+    # up to the first missing run, or of every run that has reached it if
+    # partial (runs evolved in parallel finish out of order)
+    filename = os.path.join(config['DIR'], 'r%03d-g%03d')
+    files = []
+    for g in range(0, int(config['GENERATIONS']) + 1, int(config['SAVE'])):
+        for run_number in range(int(config['RUNS'])):
+            arquivo = filename % (run_number, g)
+            if not os.path.exists(arquivo):
+                if partial:
+                    continue
+                break
+            files.append((run_number, g, arquivo))
+    return files
+
+def column(checkpoint, i, name, default = np.nan):
+    # Values of an attribute of the individuals of population i, with default
+    # for the individuals without it
+    pop = checkpoint.populations[i]
+    if name in pop:
+        return pop[name]
+    values = np.full(len(pop['genes']), default)
+    objects = checkpoint.header['populations'][i]['objects']
+    for k, v in objects.get(name, {}).items():
+        values[k] = default if v is None else v
+    return values
+
+def extract(filename):
+    # Columns of the individuals in a checkpoint
+    checkpoint = ga.read_checkpoint(filename)
+    pops = checkpoint.populations
+    columns = {'pop': np.concatenate([np.full(len(pop['genes']), i)
+                                      for i, pop in enumerate(pops)])}
+    for name in COLUMNS[3:7]:
+        columns[name] = np.concatenate([column(checkpoint, i, name)
+                                        for i in range(len(pops))])
+    columns['count'] = np.concatenate([pop['count'] for pop in pops])
+    columns['skipped_trials'] = np.concatenate(
+        [column(checkpoint, i, 'skipped_trials', 0) for i in range(len(pops))])
+    genes = np.concatenate([pop['genes'] for pop in pops])
+    # The first fully evaluated individual with the highest fitness
+    columns['best_genes'] = genes[np.argmax(np.where(
+        columns['skipped_trials'] == 0, columns['fitness'], -np.inf))]
+    return columns
+
+def signature(files):
+    return np.array(['%s %d %d' % (arquivo, os.stat(arquivo).st_size,
+                                   os.stat(arquivo).st_mtime_ns)
+                     for run_number, g, arquivo in files])
+
+def load_table(config, workers = None, partial = False):
+    # Returns the table as a dict of arrays. The columns extracted from each
+    # checkpoint are cached, so only new or changed checkpoints are read.
+    files = checkpoint_files(config, partial)
+    if not files:
+        raise FileNotFoundError('No checkpoints in %s' % config['DIR'])
+    cache = os.path.join(config['DIR'], CACHE_FILE)
+    signatures = signature(files)
+    extracted = read_cache(cache)
+    cached = set(extracted)
+    new = {s: f[2] for f, s in zip(files, signatures) if s not in extracted}
+    if len(new) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            columns = executor.map(extract, new.values(), chunksize = 8)
+            extracted.update(zip(new, columns))
+    else:
+        extracted.update((s, extract(arquivo)) for s, arquivo in new.items())
+    extracted = [extracted[s] for s in signatures]
+    table = {}
+    for name in COLUMNS[2:]:
+        table[name] = np.concatenate([columns[name] for columns in extracted])
+    sizes = [len(columns['pop']) for columns in extracted]
+    table['run'] = np.repeat([f[0] for f in files], sizes)
+    table['g'] = np.repeat([f[1] for f in files], sizes)
+    table['best_run'] = np.array([f[0] for f in files])
+    table['best_g'] = np.array([f[1] for f in files])
+    table['best_genes'] = np.array([columns['best_genes'] for columns in extracted])
+    if cached != set(signatures):
+        with open(cache + '.tmp', 'wb') as f:
+            np.savez(f, signature = signatures, sizes = sizes, **table)
+        os.replace(cache + '.tmp', cache)
+    return table
+
+def read_cache(cache):
+    # Returns the columns extracted from each checkpoint, by signature
+    extracted = {}
+    if not os.path.exists(cache):
+        return extracted
+    with np.load(cache) as data:
+        if 'sizes' not in data:
+            return extracted
+        table = {name: data[name] for name in COLUMNS[2:] + ('best_genes',)}
+        start = 0
+        for i, (s, size) in enumerate(zip(data['signature'], data['sizes'])):
+            columns = {name: table[name][start:start + size]
+                       for name in COLUMNS[2:]}
+            columns['best_genes'] = table['best_genes'][i]
+            extracted[s] = columns
+            start += size
+    return extracted
+
+def evaluated(table):
+    # The individuals evaluated in all trials, not pruned or raced, whose
+    # statistics are complete
+    return table['skipped_trials'] == 0
+
+def run_medians(table, g, values):
+    # Medians of the values of the fully evaluated individuals of each run in
+    # generation g, ignoring NaNs, for the runs with any values
+    medians = []
+    for run_number in np.unique(table['run'][table['g'] == g]):
+        v = values[(table['g'] == g) & (table['run'] == run_number) &
+                   evaluated(table)]
+        v = v[~np.isnan(v)]
+        if len(v) > 0:
+            medians.append(np.median(v))
+    return np.array(medians)
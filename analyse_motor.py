@@ -15,73 +15,81 @@
 #You should have received a copy of the GNU General Public License
 #along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys, math
+import sys, os, io
+import numpy as np
 
-def avg(l):
-    return sum(l) / float(len(l))
-
-def stdev(l, avg):
-    s = 0.0
-    for i in l:
-        s += (avg - i) ** 2
-    return math.sqrt(s / (len(l) - 1))
-
-def key(a):
-    if a is None:
-        return 2000
-    else:
-        return a
-
-def median(l):
-    if len(l) == 0:
-        return None
-    l.sort(key = key)
-    if len(l) % 2 == 0:
-        return avg((l[len(l) // 2 - 1], l[len(l) // 2]))
-    else:
-        return l[len(l) // 2]
-
-import rtexp, ga, os, time
+import rtexp, aggregate
 from rtexp import config
 
-print("type,noise,g,variable,value")
-for g in range(0, rtexp.GENERATIONS + 1, rtexp.SAVE):
-    totals = [list() for i in range(8)]
-    for run_number in range(rtexp.RUNS):
-        t = [list() for i in range(8)]
-        arquivo = rtexp.ARQUIVO % (run_number, g)
-        if not os.path.exists(arquivo):
-            break
-        run = ga.Run.load(open(arquivo, 'rb'))
-        for pop in run:
-            for c in pop:
-                #trials = rtexp.ChoiceRTTask()
-                #trials.run(c, rtexp.make_network(c))
-                t[0].append(c.fitness)
-                if c.rt_valid is not None:
-                    t[1].append(c.rt_valid)
-                if c.rt_neutral is not None:
-                    t[2].append(c.rt_neutral)
-                if c.rt_invalid is not None:
-                    t[3].append(c.rt_invalid)
-                t[4].append(c.count[0]) # resp
-                t[5].append(c.count[1]) # miss
-                t[6].append(c.count[2]) # anticipated
-                try: # wrong
-                    t[7].append(c.count[3])
-                except IndexError:
-                    t[7].append(0)
-                assert (c.count[0] + c.count[1]) == (rtexp.REPS * 2 * (rtexp.VALID + rtexp.INVALID + rtexp.NEUTRAL))
-        for rt, gt in zip(t, totals):
-            i = median(rt)
-            if i is not None:
-                gt.append(i)
-    for var, total in zip(("Fitness", "Valid", "Neutral", "Invalid", "Responses", "Misses", "Anticipated", "Wrong"), totals):
-        print(config['TYPE'], config['NOISE_SIGMA'], g, var, sep=',', end=',')
+# In incremental mode (see below), runs may be missing from any generation
+table = aggregate.load_table(config, partial = len(sys.argv) > 2)
+count = table['count']
+# Wrong responses, if counted
+wrong = count[:, 3] if count.shape[1] > 3 else np.zeros(len(count))
+variables = (("Fitness", table['fitness']), ("Valid", table['rt_valid']),
+             ("Neutral", table['rt_neutral']), ("Invalid", table['rt_invalid']),
+             ("Responses", count[:, 0]), ("Misses", count[:, 1]),
+             ("Anticipated", count[:, 2]), ("Wrong", wrong))
+complete = aggregate.evaluated(table)
+assert ((count[complete, 0] + count[complete, 1]) == (rtexp.REPS * 2 * (rtexp.VALID + rtexp.INVALID + rtexp.NEUTRAL))).all()
+
+def print_generation(g, file = sys.stdout):
+    for var, values in variables:
+        total = aggregate.run_medians(table, g, values)
+        print(config['TYPE'], config['NOISE_SIGMA'], g, var, sep=',', end=',', file=file)
         if len(total) > 0:
-            a = avg(total)
-            print(a)
+            print(np.mean(total), file=file)
         else:
-            print('')
-    
-    
\ No newline at end of file
+            print('', file=file)
+
+generations = range(0, rtexp.GENERATIONS + 1, rtexp.SAVE)
+if len(sys.argv) > 2:
+    # Incremental mode: writes to a CSV file the generations that any run has
+    # reached, with the number of runs each row covers. The rows of a
+    # generation are replaced when more runs have reached it.
+    arquivo = sys.argv[2]
+    header = "type,noise,g,variable,value,runs"
+    rows = []
+    done = {}
+    rewrite = True
+    if os.path.exists(arquivo):
+        with open(arquivo) as f:
+            lines = f.read().splitlines()
+        rewrite = not lines or lines[0] != header
+        for row in lines[1:]:
+            fields = row.split(',')
+            if len(fields) < 6:
+                # Written when only complete generations were saved
+                fields.append(str(rtexp.RUNS))
+            exptype, noise, g = fields[:3]
+            if exptype == config['TYPE'] and noise == config['NOISE_SIGMA']:
+                done[int(g)] = int(fields[5])
+            rows.append(fields)
+    new = {}
+    for g in generations:
+        runs = len(np.unique(table['run'][table['g'] == g]))
+        if runs > done.get(g, 0):
+            f = io.StringIO()
+            print_generation(g, f)
+            new[g] = [row + ',%d' % runs for row in f.getvalue().splitlines()]
+    superseded = [fields for fields in rows
+                  if fields[0] == config['TYPE'] and fields[1] == config['NOISE_SIGMA']
+                  and int(fields[2]) in new]
+    if superseded or rewrite:
+        # Rewrites the file without the superseded rows
+        with open(arquivo + '.tmp', 'w') as f:
+            print(header, file=f)
+            for fields in rows:
+                if fields not in superseded:
+                    print(','.join(fields), file=f)
+            for g_rows in new.values():
+                print('\n'.join(g_rows), file=f)
+        os.replace(arquivo + '.tmp', arquivo)
+    else:
+        with open(arquivo, 'a') as f:
+            for g_rows in new.values():
+                print('\n'.join(g_rows), file=f)
+else:
+    print("type,noise,g,variable,value")
+    for g in generations:
+        print_generation(g)
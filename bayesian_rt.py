@@ -18,6 +18,7 @@
 import random
 import sys
 import math
+import numpy as np
 
 # Maximum time the target can appear
 tmax = None
@@ -176,6 +177,125 @@ def trial(Seq, r, ta, s, sigma):
         probnA /= den
         yield probAe, probAd
 
+# Log-domain versions, which do not underflow for small sigma or large s
+
+def log_likelihoods(S, s, sigma):
+    # Logs of lSAe and lSAd minus the log of lSnA. The three share the
+    # quadratic terms, and differ only in which channel carries the signal.
+    Se, Sd = S
+    k = s / sigma ** 2
+    return k * (Se - s / 2), k * (Sd - s / 2)
+
+def posterior(logAe, logAd, probAe, probAd, probnA):
+    # Normalized products of the probabilities and the likelihoods relative
+    # to lSnA, given by their logs. The likelihoods are divided by the
+    # largest one with a non-zero probability, so only the others need exp
+    # and den is never zero.
+    m = max(logAe if probAe > 0 else -math.inf,
+            logAd if probAd > 0 else -math.inf,
+            0 if probnA > 0 else -math.inf)
+    if logAe < m:
+        probAe *= math.exp(logAe - m)
+    if logAd < m:
+        probAd *= math.exp(logAd - m)
+    if m > 0:
+        probnA *= math.exp(-m)
+    den = probAe + probAd + probnA
+    return probAe / den, probAd / den, probnA / den
+
+def trial_log(Seq, r, ta, s, sigma):
+    probAe = 0 # Probability that the target has appeared on the left
+    probAd = 0 # Probability that the target has appeared on the right
+    probnA = 1 # Probability that the target has not appeared yet
+
+    for t, S in zip(range(1, len(Seq) + 1), Seq):
+        probAe, probAd, probnA = posterior(*log_likelihoods(S, s, sigma),
+            probAe + probnA * prob_target(r, t),
+            probAd + probnA * prob_target(1 - r, t),
+            probnA * prob_not_target(t))
+        yield probAe, probAd
+
+def trial_multi(Seq, rs, ta, s, sigma):
+    # Same as trial_log for several cue validities rs at once, with the
+    # likelihoods computed once per step. Yields a list of (probAe, probAd),
+    # one for each r. Seq may be an iterator, drawn as the trial goes on.
+    probs = [(0, 0, 1)] * len(rs)
+
+    for t, S in enumerate(Seq, 1):
+        logAe, logAd = log_likelihoods(S, s, sigma)
+        m = max(logAe, logAd, 0)
+        lAe, lAd, lnA = math.exp(logAe - m), math.exp(logAd - m), math.exp(-m)
+        new_probs = []
+        for r, (probAe, probAd, probnA) in zip(rs, probs):
+            probAe += probnA * prob_target(r, t)
+            probAd += probnA * prob_target(1 - r, t)
+            probnA *= prob_not_target(t)
+            if (probAe if m == logAe else probAd if m == logAd else probnA) > 0:
+                probAe *= lAe
+                probAd *= lAd
+                probnA *= lnA
+                den = probAe + probAd + probnA
+                new_probs.append((probAe / den, probAd / den, probnA / den))
+            else:
+                # The most likely hypothesis is impossible
+                new_probs.append(posterior(logAe, logAd, probAe, probAd, probnA))
+        probs = new_probs
+        yield [(probAe, probAd) for probAe, probAd, probnA in probs]
+
+def trial2_log(Seq, r, ta, s, sigma):
+    numAe = 0
+    numAd = 0
+    numnA = 1
+
+    for t, S in zip(range(1, tmax + 1), Seq):
+        # Only works for 1 <= t <= tmax!
+        numAe, numAd, numnA = posterior(*log_likelihoods(S, s, sigma),
+            numAe + numnA / acProbnA(t - 1) * (r / tmax),
+            numAd + numnA / acProbnA(t - 1) * ((1 - r) / tmax),
+            numnA * (tmax - t) / (tmax - t + 1))
+        yield numAe, numAd
+
+# NumPy versions, for many trials at once
+
+def S_array(rng, n, T, ta, s, sigma):
+    # Sequences of stimuli of n trials, shape (n, T, 2), target on the left
+    # ta: time the target appears in each trial
+    Seq = rng.normal(0, sigma, (n, T, 2))
+    Seq[:, :, 0] += s * (np.arange(1, T + 1) >= ta[:, None])
+    return Seq
+
+def log_likelihoods_array(Seq, s, sigma):
+    # log_likelihoods of each stimulus in a (n, T, 2) array
+    k = s / sigma ** 2
+    return k * (Seq[:, :, 0] - s / 2), k * (Seq[:, :, 1] - s / 2)
+
+def trial_array(logAe, logAd, rs, tmax):
+    # Same as trial_log for n sequences of log likelihoods, shape (n, T), and
+    # several cue validities rs at once. Yields t and arrays of shape
+    # (n, len(rs)) with the probabilities that the target has appeared on
+    # the left and on the right.
+    rs = np.asarray(rs, dtype = float)
+    probAe = np.zeros((len(logAe), len(rs)))
+    probAd = np.zeros((len(logAe), len(rs)))
+    probnA = np.ones((len(logAe), len(rs)))
+    for t in range(1, logAe.shape[1] + 1):
+        # Probability that the target appears at t if it has not appeared yet
+        hazard = 1 / (tmax - t + 1) if t < tmax else 1
+        probAe = probAe + probnA * rs * hazard
+        probAd = probAd + probnA * (1 - rs) * hazard
+        probnA = probnA * (1 - hazard)
+        lAe = np.where(probAe > 0, logAe[:, t - 1, None], -np.inf)
+        lAd = np.where(probAd > 0, logAd[:, t - 1, None], -np.inf)
+        m = np.maximum(np.maximum(lAe, lAd), np.where(probnA > 0, 0, -np.inf))
+        probAe = probAe * np.exp(lAe - m)
+        probAd = probAd * np.exp(lAd - m)
+        probnA = probnA * np.exp(-m)
+        den = probAe + probAd + probnA
+        probAe /= den
+        probAd /= den
+        probnA /= den
+        yield t, probAe, probAd
+
 def mean_stder(l):
     m = sum(l) / len(l)
     v = sum([(i - m) ** 2 for i in l]) / (len(l) - 1)
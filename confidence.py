@@ -0,0 +1,29 @@
+#Copyright 2014, 2015 Carolina Feher da Silva
+#
+#This file is part of rtexp.
+#
+#rtexp is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#rtexp is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
+
+# Confidence intervals shared by the analyses of the motor and sensory models
+
+import numpy as np
+import scipy.stats
+
+# Fonte: http://stackoverflow.com/questions/15033511/compute-a-confidence-interval-from-sample-data
+def mean_confidence_interval(data, confidence = 0.95):
+    a = np.asarray(data, dtype = float)
+    n = len(a)
+    m, se = np.mean(a), scipy.stats.sem(a)
+    h = se * scipy.stats.t.ppf((1 + confidence) / 2, n - 1)
+    return m, m - h, m + h
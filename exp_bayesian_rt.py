@@ -17,8 +17,9 @@
 
 from scipy import integrate
 from numpy import inf
+import numpy as np
 import math, sys, random, bayesian_rt
-from bayesian_rt import S, trial, mean_stder
+from bayesian_rt import S, trial_multi, mean_stder
     
 def simple_task(REPS):
     rtv = []
@@ -28,17 +29,21 @@ def simple_task(REPS):
     correct = [0, 0, 0]
     for tn in range(REPS):
         ta = random.randint(1, bayesian_rt.tmax)
-        Seq = [S(i + 1, 'L', ta, s, sigma) for i in range(bayesian_rt.tmax)]
-        for i, (rtl, pista) in enumerate(((rtv, r), (rtn, 0.5), (rti, (1 - r)))):
-            for t, (pAe, pAd) in zip(range(1, bayesian_rt.tmax + 1), trial(Seq, pista, ta, s, sigma)):
-                if (pAe + pAd) >= acmin:
+        # The stimuli are drawn as needed, the same for all cue conditions
+        Seq = (S(i + 1, 'L', ta, s, sigma) for i in range(bayesian_rt.tmax))
+        responded = [False, False, False]
+        for t, probs in zip(range(1, bayesian_rt.tmax + 1), trial_multi(Seq, (r, 0.5, 1 - r), ta, s, sigma)):
+            for i, (rtl, (pAe, pAd)) in enumerate(zip((rtv, rtn, rti), probs)):
+                if not responded[i] and (pAe + pAd) >= acmin:
+                    responded[i] = True
                     rt = t
                     if rt >= ta:
                         rtl.append(rt - ta)
                         correct[i] += 1
                     else:
                         anticipated[i] += 1
-                    break
+            if all(responded):
+                break
     for i in range(3):
         assert (correct[i] + anticipated[i]) == REPS
         print(correct[i] / REPS, anticipated[i] / REPS, sep='\t')
@@ -54,10 +59,15 @@ def choice_task(REPS):
     correct = [0, 0, 0]
     for tn in range(REPS):
         ta = random.randint(1, bayesian_rt.tmax)
-        Seq = [S(i + 1, 'L', ta, s, sigma) for i in range(bayesian_rt.tmax * 10)]
-        for i, (rtl, pista) in enumerate(((rtv, r), (rtn, 0.5), (rti, (1 - r)))):
-            for t, (pAe, pAd) in zip(range(1, bayesian_rt.tmax * 10 + 1), trial(Seq, pista, ta, s, sigma)):
+        # The stimuli are drawn as needed, the same for all cue conditions
+        Seq = (S(i + 1, 'L', ta, s, sigma) for i in range(bayesian_rt.tmax * 10))
+        responded = [False, False, False]
+        for t, probs in zip(range(1, bayesian_rt.tmax * 10 + 1), trial_multi(Seq, (r, 0.5, 1 - r), ta, s, sigma)):
+            for i, (rtl, (pAe, pAd)) in enumerate(zip((rtv, rtn, rti), probs)):
+                if responded[i]:
+                    continue
                 if pAe >= acmin:
+                    responded[i] = True
                     rt = t
                     if rt < ta:
                         anticipated[i] += 1
@@ -70,22 +80,95 @@ def choice_task(REPS):
                     else:
                         rtl.append(rt - ta)
                         correct[i] += 1
-                    break
                 elif pAd >= acmin:
+                    responded[i] = True
                     rt = t
                     if rt < ta:
                         anticipated[i] += 1
                     else:
                         wrong[i] += 1
-                    break
-            else:
-              missed[i] += 1
+            if all(responded):
+                break
+        for i in range(3):
+            if not responded[i]:
+                missed[i] += 1
     for i in range(3):
         assert (correct[i] + wrong[i] + anticipated[i] + missed[i]) == REPS
         errors = wrong[i] + anticipated[i] + missed[i]
         print(correct[i] / REPS, errors / REPS, wrong[i] / REPS, anticipated[i] / REPS, missed[i] / REPS, sep='\t')
     return rtv, rtn, rti
 
+# NumPy engine: runs the trials in chunks, each chunk for the three cue
+# conditions at once
+
+# Maximum number of stimuli drawn at once
+CHUNK_STIMULI = 1 << 22
+
+def run_trials(exp_type, REPS, s, sigma, tmax, r, acmin, rng):
+    # Returns the counts of each outcome, one row per cue condition (valid,
+    # neutral, invalid), and the RTs of the correct responses in each
+    # condition. The outcomes are correct and anticipated responses for SRT,
+    # and correct, wrong, anticipated and missed responses for CRT.
+    T = tmax if exp_type == 'SRT' else tmax * 10
+    n = max(1, CHUNK_STIMULI // T)
+    counts = np.zeros((3, 2 if exp_type == 'SRT' else 4), dtype = int)
+    rts = [[], [], []]
+    for start in range(0, REPS, n):
+        chunk_counts, chunk_rts = run_chunk(exp_type, min(n, REPS - start),
+                                            T, s, sigma, tmax, r, acmin, rng)
+        counts += chunk_counts
+        for rtl, chunk_rtl in zip(rts, chunk_rts):
+            rtl.append(chunk_rtl)
+    return counts, [np.concatenate(rtl) for rtl in rts]
+
+def run_chunk(exp_type, n, T, s, sigma, tmax, r, acmin, rng):
+    ta = rng.integers(1, tmax, n, endpoint = True)
+    Seq = bayesian_rt.S_array(rng, n, T, ta, s, sigma)
+    # Time of the response (0 if none) and probabilities at that time
+    rt = np.zeros((n, 3), dtype = int)
+    pAe = np.zeros((n, 3))
+    pAd = np.zeros((n, 3))
+    for t, probAe, probAd in bayesian_rt.trial_array(
+            *bayesian_rt.log_likelihoods_array(Seq, s, sigma), (r, 0.5, 1 - r),
+            tmax):
+        if exp_type == 'SRT':
+            crossed = (probAe + probAd) >= acmin
+        else:
+            crossed = (probAe >= acmin) | (probAd >= acmin)
+        crossed &= rt == 0
+        rt[crossed] = t
+        pAe[crossed] = probAe[crossed]
+        pAd[crossed] = probAd[crossed]
+        if rt.all():
+            break
+    ta = ta[:, None]
+    responded = rt > 0
+    anticipated = responded & (rt < ta)
+    if exp_type == 'SRT':
+        correct = responded & ~anticipated
+        outcomes = (correct, anticipated)
+    else:
+        left = responded & ~anticipated & (pAe >= acmin)
+        both = left & (pAd >= acmin)
+        # Chooses at random if both probabilities reached the threshold
+        correct = left & ~(both & (rng.random(rt.shape) >= 0.5))
+        wrong = responded & ~anticipated & ~correct
+        outcomes = (correct, wrong, anticipated, ~responded)
+    counts = np.array([outcome.sum(axis = 0) for outcome in outcomes]).T
+    rts = [(rt - ta)[correct[:, i], i] for i in range(3)]
+    return counts, rts
+
+def print_counts(counts, REPS):
+    for row in counts:
+        assert row.sum() == REPS
+        if len(row) == 2:
+            correct, anticipated = row
+            print(correct / REPS, anticipated / REPS, sep='\t')
+        else:
+            correct, wrong, anticipated, missed = row
+            errors = wrong + anticipated + missed
+            print(correct / REPS, errors / REPS, wrong / REPS, anticipated / REPS, missed / REPS, sep='\t')
+
 if __name__ == '__main__':
     try:
         # Parameters
@@ -107,8 +190,10 @@ if __name__ == '__main__':
         except Exception:
             REPS = 1000
         assert REPS > 0
+        engine = sys.argv[8] if len(sys.argv) > 8 else 'numpy'
+        assert engine == 'numpy' or engine == 'python'
     except:
-        print("This script expects six required parameters and one optional parameter:")
+        print("This script expects six required parameters and two optional parameters:")
         print("  1. s: stimulus intensity, s > 0")
         print("  2. sigma: noise intensity, sigma > 0")
         print("  3. tmax: maximum time the target can appear")
@@ -117,9 +202,13 @@ if __name__ == '__main__':
         print("  5. acmin: minimum accuracy (0 <= acmin <= 1)")
         print("  6. exp_type: experiment type (SRT or CRT)")
         print("  7. REPS: number of trials (REPS > 0)")
+        print("  8. engine: numpy (default) or python")
         sys.exit(0)
   
-    if exp_type == 'SRT':
+    if engine == 'numpy':
+        counts, (rtv, rtn, rti) = run_trials(exp_type, REPS, s, sigma, bayesian_rt.tmax, r, acmin, np.random.default_rng())
+        print_counts(counts, REPS)
+    elif exp_type == 'SRT':
         rtv, rtn, rti = simple_task(REPS)
     else:
         rtv, rtn, rti = choice_task(REPS)
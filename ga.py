@@ -17,11 +17,16 @@
 
 # Simple Genetic Algorithm
 
-import random, pickle
+import random, pickle, os, collections, copy, io, mmap, struct, queue, threading, multiprocessing
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor, Future,
+                                wait, FIRST_COMPLETED)
 
 randobj = random.Random()
 
 class Gene(float):
+    # Kept to load old checkpoints, in which chromosomes are tuples of genes
     MUTATION_RATE = 0.05
     def __new__(cls, min_value, max_value, mutation_step, value = None):
         if value == None:
@@ -34,47 +39,217 @@ class Gene(float):
         return x
     def __getnewargs__(x):
         return (x.__minv, x.__maxv, x.__mutstep, float(x))
-    def get_random(self):
-        return type(self)(self.__minv, self.__maxv, self.__mutstep)
-    def copy(self):
-        if randobj.random() < self.MUTATION_RATE:
-            # Mutate
-            stepdn = - min([self.__mutstep, self - self.__minv])
-            stepup = min([self.__mutstep, self.__maxv - self])
-            x = self + randobj.uniform(stepdn, stepup)
-            return self.__class__(self.__minv, self.__maxv, self.__mutstep, x)
-        else:
-            return self
+    def get_bounds(x):
+        return x.__minv, x.__maxv, x.__mutstep
+
+def get_numpy_random():
+    # NumPy generator seeded from randobj, so runs stay reproducible
+    return np.random.default_rng(randobj.getrandbits(64))
+
+class Genome:
+    # Minimum and maximum values and mutation steps of the genes of a
+    # chromosome, shared by all chromosomes of the same kind
+    MUTATION_RATE = Gene.MUTATION_RATE
+    def __init__(self, min_values, max_values, mutation_steps):
+        self.min_values = np.array(min_values, dtype = float)
+        self.max_values = np.array(max_values, dtype = float)
+        self.mutation_steps = np.array(mutation_steps, dtype = float)
+        assert(self.min_values.shape == self.max_values.shape ==
+               self.mutation_steps.shape)
+    @classmethod
+    def uniform(cls, n, min_value, max_value, mutation_step):
+        return cls([min_value] * n, [max_value] * n, [mutation_step] * n)
+    def __len__(self):
+        return len(self.min_values)
+    def get_random(self, rng):
+        return rng.uniform(self.min_values, self.max_values)
+    def mutate(self, genes, rng):
+        mutated = rng.random(len(genes)) < self.MUTATION_RATE
+        x = genes[mutated]
+        stepdn = -np.minimum(self.mutation_steps[mutated],
+                             x - self.min_values[mutated])
+        stepup = np.minimum(self.mutation_steps[mutated],
+                            self.max_values[mutated] - x)
+        x += rng.uniform(stepdn, stepup)
+        genes[mutated] = np.clip(x, self.min_values[mutated],
+                                 self.max_values[mutated])
 
 class Chromosome:
-    def __init__(self, list_genes, fitness = None):
-        self.__genes = tuple(list_genes)
+    # genes: a float64 NumPy vector, read-only once the chromosome is created
+    def __init__(self, genes, genome, fitness = None):
+        self.genes = np.array(genes, dtype = float)
+        self.genes.flags.writeable = False
+        assert(len(self.genes) == len(genome))
+        self.genome = genome
         self.fitness = fitness
+    def __setstate__(self, state):
+        if '_Chromosome__genes' in state:
+            # Old checkpoint
+            genes = state.pop('_Chromosome__genes')
+            state['genes'] = np.array(genes, dtype = float)
+            state['genome'] = _old_genome(genes)
+        vars(self).update(state)
+        self.genes.flags.writeable = False
     def __getitem__(self, key):
-        return self.__genes[key]
-    def get_random(self):
-        return self.__class__([gene.get_random() for gene in self])
+        return self.genes[key]
+    def __iter__(self):
+        return iter(self.genes)
+    @classmethod
+    def get_random(cls, genome, rng = None):
+        if rng is None:
+            rng = get_numpy_random()
+        return cls(genome.get_random(rng), genome)
     def __lt__(self, other):
         return self.fitness < other.fitness
     def get_child(p1, p2):
-        child = []
-        for i, g in enumerate(p1):
-            child.append(randobj.choice((g, p2[i])))
-        return p1.__class__([gene.copy() for gene in child])
+        rng = get_numpy_random()
+        genes = np.where(rng.random(len(p1)) < 0.5, p1.genes, p2.genes)
+        p1.genome.mutate(genes, rng)
+        return p1.__class__(genes, p1.genome)
     def __len__(self):
-        return len(self.__genes)
+        return len(self.genes)
     def __str__(self):
-        return str(self.__genes)
+        return str(tuple(self.genes.tolist()))
+
+_old_genomes = {}
+
+def _old_genome(genes):
+    # One genome for all chromosomes with the same genes in old checkpoints
+    bounds = tuple(gene.get_bounds() for gene in genes)
+    if bounds not in _old_genomes:
+        _old_genomes[bounds] = Genome(*zip(*bounds))
+    return _old_genomes[bounds]
+
+class Evaluator:
+    # Evaluates each individual by calling function(genes, seed, bound), which
+    # returns a dict of attributes (fitness, etc.) to be set on the individual.
+    # The seeds are drawn from randobj in order, so the results do not depend
+    # on how the calls are distributed.
+    # If a schedule function is given, it is called once per evaluation of a
+    # population with a NumPy generator seeded from randobj, and its result is
+    # stored in pop.schedule and passed to every individual instead of a seed,
+    # so that they are all evaluated in the same conditions.
+    # If PRUNE is set, the elite carried over in the population is evaluated
+    # first, on the current schedule, and bound is its fitness, so the
+    # function may stop evaluating the other individuals early, e.g. those
+    # that cannot reach it, setting their skipped_trials attribute. Otherwise,
+    # and for the elite itself, it is None. Partially evaluated individuals
+    # never become the elite (see fittest()).
+    # If cache_size > 0, the results for the last cache_size different
+    # chromosomes are reused, except for partial (pruned) evaluations.
+    # Individuals can also be submitted one at a time, without the cache.
+    # The number of evaluations run and the sums of the TOTALS attributes of
+    # their results are added up per generation (see Population.history).
+    PRUNE = False
+    TOTALS = ()
+    # Number of evaluations that can run at the same time
+    workers = 1
+    def __init__(self, function, cache_size = 0, schedule = None):
+        self.function = function
+        self.cache_size = cache_size
+        self.schedule = schedule
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    def __call__(self, pop):
+        self.draw_schedule(pop)
+        bound = self.evaluate_elite(pop)
+        inds = [c for c in pop if bound is None or c is not pop.max_ind]
+        jobs = [self.job(pop, c, bound) for c in inds]
+        if not self.cache_size:
+            results = self.map(jobs)
+            pop.add_totals(results)
+        else:
+            results = self.cached_map(jobs, pop)
+        for c, result in zip(inds, results):
+            for attr, value in result.items():
+                setattr(c, attr, value)
+    def draw_schedule(self, pop):
+        if self.schedule is not None:
+            pop.schedule = self.schedule(get_numpy_random())
+    def evaluate_elite(self, pop):
+        # With PRUNE, evaluates the elite of pop, if it is still in pop, and
+        # returns its fitness as the bound for the other individuals
+        elite = getattr(pop, 'max_ind', None)
+        if not self.PRUNE or not any(c is elite for c in pop):
+            return None
+        result = self.function(*self.job(pop, elite))
+        for attr, value in result.items():
+            setattr(elite, attr, value)
+        pop.add_totals([result])
+        return elite.fitness
+    def job(self, pop, c, bound = None):
+        # Arguments of the function for individual c of population pop
+        if self.schedule is None:
+            return c.genes, randobj.getrandbits(64), bound
+        return c.genes, pop.schedule, bound
+    def submit(self, pop, c, bound = None):
+        # Evaluates individual c of population pop, returns a Future with the
+        # dict of attributes
+        future = Future()
+        future.set_result(self.function(*self.job(pop, c, bound)))
+        return future
+    def cached_map(self, jobs, pop):
+        keys = [genes.tobytes() for genes, seed, bound in jobs]
+        new = {}
+        for key, job in zip(keys, jobs):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+            elif key not in new:
+                new[key] = job
+                self.misses += 1
+            else:
+                self.hits += 1
+        results = dict(zip(new, self.map(list(new.values())) if new else []))
+        pop.add_totals(results.values())
+        results = [results[key] if key in results else self.cache[key]
+                   for key in keys]
+        for key, result in zip(keys, results):
+            if key in new and not result.get('skipped_trials'):
+                self.cache[key] = result
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last = False)
+        return results
+    def map(self, jobs):
+        return [self.function(genes, seed, bound) for genes, seed, bound in jobs]
+
+class PoolEvaluator(Evaluator):
+    executor_class = None
+    def __init__(self, function, workers = None, cache_size = 0, schedule = None):
+        super().__init__(function, cache_size, schedule)
+        self.workers = workers or os.cpu_count()
+        self.executor = None
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = self.executor_class(self.workers)
+        return self.executor
+    def map(self, jobs):
+        chunksize = max(1, len(jobs) // (4 * self.workers))
+        return list(self.get_executor().map(self.function, *zip(*jobs),
+                                            chunksize = chunksize))
+    def submit(self, pop, c, bound = None):
+        return self.get_executor().submit(self.function, *self.job(pop, c, bound))
+
+class ProcessPoolEvaluator(PoolEvaluator):
+    executor_class = ProcessPoolExecutor
+
+class ThreadPoolEvaluator(PoolEvaluator):
+    # Only useful if the fitness function releases the GIL
+    executor_class = ThreadPoolExecutor
 
 class Population:
     ELITE = True
     RANDOM_INDIVIDUALS = 0
+    # Number of generations kept in history
+    HISTORY = 1
     evaluate_fitness = None
     def __init__(self, list_individuals):
         self.age = 0
         self.__inds = list_individuals
         Population.evaluate_fitness(self)
-        self.max_ind = max(self)
+        self.__end_totals()
+        self.max_ind = fittest(self)
         self.no_improvement_age = 0
         self.__mean_fitness = float(sum([i.fitness for i in self])) / len(self)
         self.max_mean_fitness = self.__mean_fitness
@@ -85,14 +260,35 @@ class Population:
         if self.ELITE:
             new_inds.append(self.max_ind)
         for i in range(self.RANDOM_INDIVIDUALS):
-            new_inds.append(self[0].get_random())
+            new_inds.append(Chromosome.get_random(self[0].genome))
         for i in range(len(self) - len(new_inds)):
             p1, p2 = self.__select(), self.__select()
             new_inds.append(p1.get_child(p2))
         assert(len(new_inds) == len(self))
         self.__inds = new_inds
         Population.evaluate_fitness(self)
-        self.max_ind = max(self)
+        self.end_generation()
+    def get_offspring(self):
+        p1, p2 = self.__select(), self.__select()
+        return p1.get_child(p2)
+    def replace_worst(self, c):
+        # Steady-state replacement of the individual with the lowest fitness
+        self.__inds[self.__inds.index(min(self))] = c
+        self.max_ind = fittest(self)
+    def add_totals(self, results):
+        # Adds up the evaluations run in the current generation
+        totals = vars(self).setdefault('totals', collections.Counter())
+        totals['evaluations'] += len(results)
+        for name in Evaluator.TOTALS:
+            totals[name] += sum(result.get(name, 0) for result in results)
+    def __end_totals(self):
+        # history: the totals of the last HISTORY generations
+        history = getattr(self, 'history', []) + [getattr(self, 'totals', collections.Counter())]
+        self.history = history[-self.HISTORY:]
+        self.totals = collections.Counter()
+    def end_generation(self):
+        self.__end_totals()
+        self.max_ind = fittest(self)
         self.__mean_fitness = float(sum([i.fitness for i in self])) / len(self)
         if self.__mean_fitness <= self.max_mean_fitness:
             self.no_improvement_age += 1
@@ -108,52 +304,421 @@ class Population:
     def __str__(self):
         return str(self.__inds)
     @classmethod
-    def get_random(cls, n, genes):
-        c = Chromosome(genes)
-        return cls([c.get_random() for i in range(n)])
+    def get_random(cls, n, genome):
+        rng = get_numpy_random()
+        return cls([Chromosome.get_random(genome, rng) for i in range(n)])
     def add_immigrant(self, im):
         i = self.__inds.index(self.max_ind)
         self.__inds[i] = im
-        self.max_ind = max(self)
+        self.max_ind = fittest(self)
     def __lt__(self, other):
         return self.max_mean_fitness < other.max_mean_fitness
 
+def fittest(inds):
+    # The individual with the highest fitness among those fully evaluated
+    complete = [c for c in inds if not getattr(c, 'skipped_trials', 0)]
+    return max(complete or inds)
+
 class Run(list):
+    STEADY_STATE = False
     def __init__(self):
         self._g = 0
     @property
     def g(self):
         return self._g
-    def iterate(self, n):
+    def iterate(self, n, islands = None):
+        # With islands, the populations evolve in them (see Islands)
+        if islands is not None:
+            islands.iterate(self, n)
+            return
+        if self.STEADY_STATE:
+            self.advance_steady_state(n)
+            return
         for g in range(n):
             self.advance()
+    def advance_steady_state(self, n):
+        # Asynchronous steady-state evolution for n generations: an offspring
+        # is submitted to the evaluator as soon as a worker is free, from the
+        # population furthest behind, and replaces the worst individual of
+        # its population when its evaluation finishes. Every len(pop)
+        # offspring make a generation of pop. With parallel evaluators the
+        # results depend on the order in which evaluations finish.
+        evaluator = Population.evaluate_fitness
+        todo = [n * len(pop) for pop in self]
+        done = [0] * len(self)
+        # Bound of the current generation of each population (see Evaluator)
+        bounds = [None] * len(self)
+        pending = {}
+        while pending or any(todo):
+            while any(todo) and len(pending) < evaluator.workers:
+                i = todo.index(max(todo))
+                pop = self[i]
+                if todo[i] % len(pop) == 0:
+                    evaluator.draw_schedule(pop)
+                    bounds[i] = evaluator.evaluate_elite(pop)
+                c = pop.get_offspring()
+                pending[evaluator.submit(pop, c, bounds[i])] = i, c
+                todo[i] -= 1
+            finished, not_finished = wait(pending, return_when = FIRST_COMPLETED)
+            for future in finished:
+                i, c = pending.pop(future)
+                for attr, value in future.result().items():
+                    setattr(c, attr, value)
+                self[i].add_totals([future.result()])
+                self[i].replace_worst(c)
+                done[i] += 1
+                if done[i] % len(self[i]) == 0:
+                    self[i].end_generation()
+        self._g += n
     def advance(self):
         self._g += 1
         for pop in self:
             pop.advance()
-    def migrate(self):
+    def migrate(self, islands = None):
         best = []
         for pop in self:
             best.append(pop.max_ind)
         randobj.shuffle(best)
         for i, pop in enumerate(self):
             pop.add_immigrant(best[i])
+        if islands is not None:
+            islands.immigrate(self, best)
     def remove_stagnant(self, max_stagnation):
         max_pop = max(self)
         for i, pop in enumerate(self[:]):
             if pop is not max_pop and pop.no_improvement_age >= max_stagnation:
                 print("Dropping population", i)
-                self[i] = Population.get_random(len(pop), pop[0])
+                self[i] = Population.get_random(len(pop), pop[0].genome)
     def dump(self, fileobj):
-        pickle.dump(randobj.getstate(), fileobj)
-        pickle.dump(self, fileobj)
+        Checkpoint.from_run(self, randobj.getstate()).write(fileobj)
     @classmethod
     def load(cls, fileobj):
-        randobj.setstate(pickle.load(fileobj))
-        return pickle.load(fileobj)
+        # Reads both checkpoints and old pickled runs
+        checkpoint = Checkpoint.from_buffer(fileobj.read())
+        randobj.setstate(checkpoint.randstate)
+        return checkpoint.to_run()
     @staticmethod
     def seed(s):
         randobj.seed(s)
     @staticmethod
     def setstate(s):
         randobj.setstate(s)
+
+class Checkpoint:
+    # A run with the chromosomes of each population stored as columns: a gene
+    # matrix, and arrays for the other attributes that are numbers (NaN for
+    # None) or tuples of integers. Anything else is pickled in the header.
+    # File format: magic, header length, pickled header, then the raw arrays,
+    # 64-byte aligned so that readers can memory-map them.
+    MAGIC = b'RTEXPCK1'
+    ALIGNMENT = 64
+    def __init__(self, header, populations):
+        self.header = header
+        # One dict of arrays per population
+        self.populations = populations
+    @property
+    def g(self):
+        return self.header['run']['_g']
+    @property
+    def randstate(self):
+        return self.header['randstate']
+    @classmethod
+    def from_run(cls, run, randstate):
+        # The state is copied deeply, as it may change (e.g. pop.totals)
+        # before a CheckpointWriter writes it
+        header = {'randstate': randstate, 'run': copy.deepcopy(vars(run)),
+                  'populations': []}
+        populations = []
+        for pop in run:
+            state = vars(pop).copy()
+            inds = state.pop('_Population__inds')
+            del state['max_ind']
+            state = copy.deepcopy(state)
+            info = {'state': state, 'size': len(inds),
+                    'max_ind': [c is pop.max_ind for c in inds].index(True),
+                    'genome': inds[0].genome, 'kinds': {}, 'objects': {}}
+            arrays = {'genes': np.array([c.genes for c in inds])}
+            names = set().union(*(vars(c) for c in inds)) - {'genes', 'genome'}
+            for name in sorted(names):
+                values = [vars(c).get(name, _missing) for c in inds]
+                kind, array = _column(values)
+                if kind is None:
+                    info['objects'][name] = {i: v for i, v in enumerate(values)
+                                             if v is not _missing}
+                else:
+                    info['kinds'][name] = kind
+                    arrays[name] = array
+            header['populations'].append(info)
+            populations.append(arrays)
+        return cls(header, populations)
+    def to_run(self):
+        run = Run.__new__(Run)
+        vars(run).update(self.header['run'])
+        for info, arrays in zip(self.header['populations'], self.populations):
+            inds = [Chromosome.__new__(Chromosome) for i in range(info['size'])]
+            for c, genes in zip(inds, arrays['genes']):
+                c.genes = genes
+                c.genes.flags.writeable = False
+                c.genome = info['genome']
+            for name, kind in info['kinds'].items():
+                for c, value in zip(inds, _values(kind, arrays[name])):
+                    setattr(c, name, value)
+            for name, values in info['objects'].items():
+                for i, value in values.items():
+                    setattr(inds[i], name, value)
+            pop = Population.__new__(Population)
+            vars(pop).update(info['state'])
+            vars(pop)['_Population__inds'] = inds
+            pop.max_ind = inds[info['max_ind']]
+            run.append(pop)
+        return run
+    def write(self, fileobj):
+        header = dict(self.header, arrays = [])
+        offset = 0
+        for arrays in self.populations:
+            layout = {}
+            for name, array in arrays.items():
+                layout[name] = (array.dtype.str, array.shape, offset)
+                offset += _aligned(array.nbytes, self.ALIGNMENT)
+            header['arrays'].append(layout)
+        data = pickle.dumps(header, pickle.HIGHEST_PROTOCOL)
+        start = len(self.MAGIC) + 8 + len(data)
+        fileobj.write(self.MAGIC + struct.pack('<Q', len(data)) + data)
+        fileobj.write(bytes(_aligned(start, self.ALIGNMENT) - start))
+        for arrays in self.populations:
+            for array in arrays.values():
+                fileobj.write(np.ascontiguousarray(array).tobytes())
+                fileobj.write(bytes(_aligned(array.nbytes, self.ALIGNMENT) -
+                                    array.nbytes))
+    @classmethod
+    def from_buffer(cls, buffer):
+        # The arrays share the buffer, which may be a memory map
+        if bytes(buffer[:len(cls.MAGIC)]) != cls.MAGIC:
+            # Old pickled run
+            fileobj = io.BytesIO(buffer)
+            randstate = pickle.load(fileobj)
+            return cls.from_run(pickle.load(fileobj), randstate)
+        length, = struct.unpack_from('<Q', buffer, len(cls.MAGIC))
+        start = len(cls.MAGIC) + 8
+        header = pickle.loads(buffer[start:start + length])
+        start = _aligned(start + length, cls.ALIGNMENT)
+        populations = []
+        for layout in header.pop('arrays'):
+            arrays = {}
+            for name, (dtype, shape, offset) in layout.items():
+                arrays[name] = np.frombuffer(buffer, dtype, int(np.prod(shape)),
+                                             start + offset).reshape(shape)
+            populations.append(arrays)
+        return cls(header, populations)
+
+def save_checkpoint(checkpoint, filename):
+    # Writes to a temporary file and renames it, so that a crash never leaves
+    # a truncated checkpoint
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as f:
+        checkpoint.write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, filename)
+
+class CheckpointWriter:
+    # Saves runs in a background thread while evolution continues. save()
+    # takes a snapshot of the run, and blocks while max_pending snapshots are
+    # waiting to be written. Write errors are raised by the next save() or
+    # by close().
+    def __init__(self, max_pending = 2):
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target = self.__write, daemon = True)
+        self.thread.start()
+    def save(self, run, filename):
+        self.__check()
+        self.queue.put((Checkpoint.from_run(run, randobj.getstate()), filename))
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.__check()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+    def __write(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is None:
+                try:
+                    save_checkpoint(*item)
+                except Exception as e:
+                    self.error = e
+    def __check(self):
+        if self.error is not None:
+            raise self.error
+
+class Islands:
+    # Evolves each population of a run in an island: a process, possibly on
+    # another host, that follows the commands sent through a connection (see
+    # serve_island). Each island has its own random state, stored in the
+    # randstate attribute of its population. The run in the coordinator is a
+    # copy, updated by iterate(), so it can be checkpointed and migrated as
+    # usual. After each iterate() every island sends back its whole
+    # population; islands only receive the populations they do not hold,
+    # and otherwise only the immigrants.
+    def __init__(self, connections, processes = ()):
+        self.connections = connections
+        self.processes = processes
+        # Population of the run that each island holds
+        self.populations = [None] * len(connections)
+    @classmethod
+    def start(cls, n, initializer = None):
+        # n islands in local processes, which call initializer first
+        connections = []
+        processes = []
+        for i in range(n):
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target = serve_island,
+                                              args = (child_conn, initializer))
+            process.start()
+            child_conn.close()
+            connections.append(conn)
+            processes.append(process)
+        return cls(connections, processes)
+    @classmethod
+    def connect(cls, addresses, n, authkey):
+        # n islands on the hosts at the given (host, port) addresses, in turn
+        return cls([Client(addresses[i % len(addresses)], authkey = authkey)
+                    for i in range(n)])
+    def iterate(self, run, n):
+        assert(len(run) <= len(self.connections))
+        for i, pop in enumerate(run):
+            if self.populations[i] is not pop:
+                if not hasattr(pop, 'randstate'):
+                    # New population, its island's random state is seeded
+                    # from randobj
+                    pop.randstate = random.Random(randobj.getrandbits(64)).getstate()
+                self.connections[i].send(('load', _pack_population(pop, pop.randstate)))
+        for conn in self.connections[:len(run)]:
+            conn.send(('advance', n))
+        for i, conn in enumerate(self.connections[:len(run)]):
+            run[i] = self.populations[i] = _unpack_population(_receive(conn))
+        run._g += n
+    def immigrate(self, run, immigrants):
+        for i, (pop, im) in enumerate(zip(run, immigrants)):
+            if self.populations[i] is pop:
+                self.connections[i].send(('immigrant', _pack_chromosome(im)))
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(('stop', None))
+            except OSError:
+                pass
+            conn.close()
+        for process in self.processes:
+            process.join()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+def serve_island(conn, initializer = None):
+    # Evolves a population following the commands received through conn:
+    # ('load', population), ('advance', n), which replies with the
+    # population, ('immigrant', chromosome) and ('stop', None). Replies with
+    # the exception if a command fails.
+    if initializer is not None:
+        initializer()
+    run = Run()
+    while True:
+        try:
+            command, arg = conn.recv()
+        except EOFError:
+            break
+        if command == 'stop':
+            break
+        try:
+            if command == 'load':
+                run[:] = [_unpack_population(arg)]
+                randobj.setstate(vars(run[0]).pop('randstate'))
+            elif command == 'advance':
+                run.iterate(arg)
+                conn.send(_pack_population(run[0], randobj.getstate()))
+            else:
+                assert(command == 'immigrant')
+                run[0].add_immigrant(_unpack_chromosome(arg, run[0][0].genome))
+        except Exception as e:
+            conn.send(e)
+    conn.close()
+
+def serve_islands(address, authkey, initializer = None):
+    # Serves islands to coordinators on other hosts, one process for each
+    # connection
+    with Listener(address, authkey = authkey) as listener:
+        while True:
+            conn = listener.accept()
+            process = multiprocessing.Process(target = serve_island,
+                                              args = (conn, initializer))
+            process.start()
+            conn.close()
+
+def _receive(conn):
+    reply = conn.recv()
+    if isinstance(reply, Exception):
+        raise reply
+    return reply
+
+def _pack_population(pop, randstate):
+    # A population and a random state in the checkpoint format
+    run = Run()
+    run.append(pop)
+    checkpoint = Checkpoint.from_run(run, randstate)
+    checkpoint.header['populations'][0]['state'].pop('randstate', None)
+    fileobj = io.BytesIO()
+    checkpoint.write(fileobj)
+    return fileobj.getvalue()
+
+def _unpack_population(data):
+    checkpoint = Checkpoint.from_buffer(data)
+    pop = checkpoint.to_run()[0]
+    pop.randstate = checkpoint.randstate
+    return pop
+
+def _pack_chromosome(c):
+    return c.genes, {k: v for k, v in vars(c).items() if k not in ('genes', 'genome')}
+
+def _unpack_chromosome(data, genome):
+    genes, attrs = data
+    c = Chromosome(genes, genome)
+    vars(c).update(attrs)
+    return c
+
+def read_checkpoint(filename):
+    # Memory-maps a checkpoint for reading
+    with open(filename, 'rb') as f:
+        return Checkpoint.from_buffer(mmap.mmap(f.fileno(), 0,
+                                                access = mmap.ACCESS_READ))
+
+_missing = object()
+
+def _column(values):
+    # Returns the kind of column and array for the values of an attribute,
+    # or (None, None) if they do not fit in an array
+    if any(v is _missing for v in values):
+        return None, None
+    if all(v is None or type(v) in (int, float) for v in values):
+        kind = 'int' if all(type(v) is not float for v in values) else 'float'
+        return kind, np.array([np.nan if v is None else v for v in values],
+                              dtype = float)
+    if all(type(v) is tuple and all(type(x) is int for x in v)
+           for v in values) and len(set(map(len, values))) == 1:
+        return 'tuple', np.array(values, dtype = np.int64)
+    return None, None
+
+def _values(kind, array):
+    if kind == 'tuple':
+        return [tuple(row) for row in array.tolist()]
+    return [None if v != v else int(v) if kind == 'int' else v
+            for v in array.tolist()]
+
+def _aligned(n, alignment):
+    return -(-n // alignment) * alignment
@@ -16,38 +16,21 @@
 //along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
 
 #include <cmath>
+#include <cstring>
 #include <iostream>
 #include "nn.hpp"
 
 using namespace iznn;
 
-Neuron::Neuron(double bias, double tau, double vrest, double vreset, double vt) :
-	_expinvtau(std::exp(-1 / tau)), _vrest(vrest), _vreset(vreset), _vt(vt), _bias(bias),
-			_v(vreset), _has_fired(false), _current(bias) {
-}
-
-void Neuron::advance() {
-	_v = _vrest + (_v - _vrest) * _expinvtau + _current;
-	if (_v >= _vt) {
-		_has_fired = true;
-		_v = _vreset;
-	} else {
-		_has_fired = false;
-	}
-	_current = _bias;
-}
-
-void Neuron::reset() {
-	_v = _vreset;
-	_has_fired = false;
-	_current = _bias;
+Neuron::Neuron(double tau, double vrest, double vreset, double vt) :
+	_expinvtau(std::exp(-1 / tau)), _vrest(vrest), _vreset(vreset), _vt(vt) {
 }
 
 Network::Network(Py_ssize_t input_neurons, Py_ssize_t output_neurons,
 		Py_ssize_t hidden_neurons, PyObject* parameters, double tau) :
-	_neurons(input_neurons + output_neurons + hidden_neurons),
+	_model(tau), _neurons(input_neurons + output_neurons + hidden_neurons),
 			_input_neurons(input_neurons), _output_neurons(output_neurons),
-			_synapses(0) {
+			_noise_sigma(0), _event_driven(false) {
 	if (input_neurons <= 0) {
 		throw BadParameters("Bad number of input neurons");
 	}
@@ -57,81 +40,196 @@ Network::Network(Py_ssize_t input_neurons, Py_ssize_t output_neurons,
 	if (hidden_neurons < 0) {
 		throw BadParameters("Bad number of hidden neurons");
 	}
-	Py_ssize_t index = 0;
-	for (std::vector<Neuron>::iterator n = _neurons.begin(); n != _neurons.end(); n++) {
+	_potential.resize(_neurons);
+	_current.resize(_neurons);
+	_bias.resize(_neurons);
+	_fired.resize(_neurons);
+	_weights.resize(_neurons * _neurons);
+	_input.resize(_input_neurons);
+	_noise.resize(_neurons);
+	for (Py_ssize_t index = 0; index < _neurons + _neurons * _neurons; index++) {
 		PyObject* ob = PySequence_GetItem(parameters, index);
 		if (!ob) {
 			throw BadParameters("Bad number of parameters");
 		}
-		double bias = PyFloat_AsDouble(ob);
+		double value = PyFloat_AsDouble(ob);
 		Py_DECREF(ob);
 		if (PyErr_Occurred()) {
 			throw BadParameters("Bad type of parameters");
 		}
-		*n = Neuron(bias, tau);
-		index++;
-	}
-	_synapses.reserve(_neurons.size() * _neurons.size());
-	for (std::vector<Neuron>::iterator pre = _neurons.begin(); pre
-			!= _neurons.end(); pre++) {
-		for (std::vector<Neuron>::iterator post = _neurons.begin(); post
-				!= _neurons.end(); post++) {
-			PyObject* ob = PySequence_GetItem(parameters, index);
-			if (!ob) {
-				throw BadParameters("Bad number of parameters");
-			}
-			double weight = PyFloat_AsDouble(ob);
-			Py_DECREF(ob);
-			if (PyErr_Occurred()) {
-				throw BadParameters("Bad type of parameters");
-			}
-			_synapses.push_back(Synapse(&*pre, &*post, weight));
-			index++;
+		if (index < _neurons) {
+			_bias[index] = value;
+		}
+		else {
+			_weights[index - _neurons] = value;
 		}
 	}
+	reset();
 }
 
-void Network::add_input(PyObject* input) {
-	for (Py_ssize_t i = 0; i < _input_neurons; i++) {
-		PyObject* ob = PySequence_GetItem(input, i);
-		if (!ob) {
+namespace {
+
+bool is_double_format(const char* format) {
+	if (!format) {
+		return false;
+	}
+	if (*format == '@' || *format == '=') {
+		format++;
+	}
+	return format[0] == 'd' && format[1] == 0;
+}
+
+}
+
+// Reads n doubles from a sequence or, if possible, directly from a buffer
+void Network::read_values(PyObject* ob, double* values, Py_ssize_t n) {
+	if (PyObject_CheckBuffer(ob)) {
+		Py_buffer view;
+		if (PyObject_GetBuffer(ob, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == 0) {
+			if (view.itemsize == sizeof(double) && is_double_format(view.format)) {
+				if (view.len < n * static_cast<Py_ssize_t>(sizeof(double))) {
+					PyBuffer_Release(&view);
+					PyErr_SetString(PyExc_IndexError, "Buffer is too small");
+					throw PythonError();
+				}
+				std::memcpy(values, view.buf, n * sizeof(double));
+				PyBuffer_Release(&view);
+				return;
+			}
+			PyBuffer_Release(&view);
+		}
+		else {
+			PyErr_Clear();
+		}
+	}
+	for (Py_ssize_t i = 0; i < n; i++) {
+		PyObject* item = PySequence_GetItem(ob, i);
+		if (!item) {
 			throw PythonError();
 		}
-		double current = PyFloat_AsDouble(ob);
-		Py_DECREF(ob);
+		values[i] = PyFloat_AsDouble(item);
+		Py_DECREF(item);
 		if (PyErr_Occurred()) {
 			throw PythonError();
 		}
-		_neurons[i].add_current(current);
 	}
 }
 
-PyObject* Network::advance_neurons() {
-	for (std::vector<Neuron>::iterator n = _neurons.begin(); n != _neurons.end(); n++) {
-		n->advance();
+void Network::add_input(PyObject* input) {
+	read_values(input, &_input[0], _input_neurons);
+	add_input(_input);
+}
+
+void Network::add_noise(PyObject* noise) {
+	read_values(noise, &_noise[0], _neurons);
+	for (Py_ssize_t i = 0; i < _neurons; i++) {
+		_current[i] += _noise[i];
 	}
-	PyObject* output = PyList_New(_output_neurons);
+}
+
+void Network::set_noise(double sigma, unsigned long long seed) {
+	_noise_sigma = sigma;
+	_gauss = std::normal_distribution<double>(0, sigma);
+	_generator.seed(seed);
+}
+
+void Network::add_native_noise() {
+	if (_noise_sigma > 0) {
+		for (Py_ssize_t i = 0; i < _neurons; i++) {
+			_current[i] += _gauss(_generator);
+		}
+	}
+}
+
+void Network::add_input(const std::vector<double>& input) {
+	for (Py_ssize_t i = 0; i < _input_neurons; i++) {
+		_current[i] += input[i];
+	}
+}
+
+void Network::read_input(PyObject* input, std::vector<double>& values) const {
+	values.resize(_input_neurons);
+	read_values(input, &values[0], _input_neurons);
+}
+
+// Adds the synaptic currents from the neurons that fired in the last step
+void Network::propagate() {
+	for (Py_ssize_t pre = 0; pre < _neurons; pre++) {
+		if (_fired[pre]) {
+			const double* w = &_weights[pre * _neurons];
+			for (Py_ssize_t post = 0; post < _neurons; post++) {
+				_current[post] += w[post];
+			}
+		}
+	}
+}
+
+void Network::update_neurons() {
+	for (Py_ssize_t i = 0; i < _neurons; i++) {
+		_fired[i] = _model.advance(_potential[i], _current[i]);
+		_current[i] = _bias[i];
+	}
+}
+
+long Network::output_mask() const {
+	long mask = 0;
+	const char* fired = &_fired[_neurons - _output_neurons];
+	for (Py_ssize_t i = 0; i < _output_neurons; i++) {
+		if (fired[i]) {
+			mask |= 1L << i;
+		}
+	}
+	return mask;
+}
+
+// Returns a list of the output neurons that fired, or writes them to the
+// output buffer if one is given
+PyObject* Network::get_output(PyObject* output) const {
+	const char* fired = &_fired[_neurons - _output_neurons];
+	if (output) {
+		Py_buffer view;
+		if (PyObject_GetBuffer(output, &view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) < 0) {
+			throw PythonError();
+		}
+		if (view.itemsize != 1 || view.len < _output_neurons) {
+			PyBuffer_Release(&view);
+			PyErr_SetString(PyExc_ValueError,
+					"Output buffer must have one byte per output neuron");
+			throw PythonError();
+		}
+		char* buf = static_cast<char*>(view.buf);
+		for (Py_ssize_t i = 0; i < _output_neurons; i++) {
+			buf[i] = fired[i];
+		}
+		PyBuffer_Release(&view);
+		Py_INCREF(output);
+		return output;
+	}
+	output = PyList_New(_output_neurons);
 	if (!output) {
 		throw PythonError();
 	}
-	std::vector<Neuron>::const_reverse_iterator n = _neurons.rbegin();
-	for (Py_ssize_t i = _output_neurons - 1; i >= 0; i--) {
-		PyObject* o = n->has_fired() ? Py_True : Py_False;
+	for (Py_ssize_t i = 0; i < _output_neurons; i++) {
+		PyObject* o = fired[i] ? Py_True : Py_False;
 		Py_INCREF(o);
 		PyList_SET_ITEM(output, i, o);
-		n++;
 	}
 	return output;
 }
 
-PyObject* Network::advance(PyObject* input)
+PyObject* Network::advance(PyObject* input, PyObject* output) {
+	add_native_noise();
+	return advance_step(input, output);
+}
+
+// The steps called one at a time from Python keep the GIL, which is only
+// worth releasing for whole trials (run_trial and run_trials)
+PyObject* Network::advance_step(PyObject* input, PyObject* output)
 try {
 	add_input(input);
-	for (std::vector<Synapse>::iterator s = _synapses.begin(); s
-			!= _synapses.end(); s++) {
-		s->advance();
-	}
-	return advance_neurons();
+	propagate();
+	update_neurons();
+	return get_output(output);
 }
 catch (PythonError) {
 	return 0;
@@ -141,17 +239,23 @@ PyObject* Network::advance_with_current(PyObject* input, double total_current)
 try {
 	add_input(input);
 	double current = total_current;
-	for (std::vector<Synapse>::iterator s = _synapses.begin(); s
-			!= _synapses.end(); s++) {
-		current += std::abs(s->advance());
+	for (Py_ssize_t pre = 0; pre < _neurons; pre++) {
+		if (_fired[pre]) {
+			const double* w = &_weights[pre * _neurons];
+			for (Py_ssize_t post = 0; post < _neurons; post++) {
+				current += std::abs(w[post]);
+			}
+		}
 	}
-	PyObject* output = advance_neurons();
-	for (std::vector<Neuron>::iterator n = _neurons.begin(); n != _neurons.end(); n++) {
-		if(n->has_fired()) {
+	propagate();
+	update_neurons();
+	for (Py_ssize_t i = 0; i < _neurons; i++) {
+		if(_fired[i]) {
 			current += ACTION_POTENTIAL_CURRENT;
 		}
-		current += std::abs(n->bias());
+		current += std::abs(_bias[i]);
 	}
+	PyObject* output = get_output();
 	PyObject* pycurrent = PyFloat_FromDouble(current);
 	if (!pycurrent) return 0;
 	PyObject* out_current = PyTuple_New(2);
@@ -171,18 +275,9 @@ PyObject* Network::advance_with_current_and_noise(PyObject* input, PyObject* noi
 {
     double total_current = 0;
     try {
-        for (Py_ssize_t i = 0; i < _neurons.size(); i++) {
-            PyObject* ob = PySequence_GetItem(noise, i);
-            if (!ob) {
-                throw PythonError();
-            }
-            double current = PyFloat_AsDouble(ob);
-            Py_DECREF(ob);
-            if (PyErr_Occurred()) {
-                throw PythonError();
-            }
-            _neurons[i].add_current(current);
-            total_current += current;
+        add_noise(noise);
+        for (Py_ssize_t i = 0; i < _neurons; i++) {
+            total_current += _noise[i];
         }
     }
     catch (PythonError) {
@@ -191,36 +286,225 @@ PyObject* Network::advance_with_current_and_noise(PyObject* input, PyObject* noi
 	return advance_with_current(input, total_current);
 }
 
-PyObject* Network::advance_with_noise(PyObject* input, PyObject* noise)
+PyObject* Network::advance_with_noise(PyObject* input, PyObject* noise,
+		PyObject* output)
 {
     try {
-        for (Py_ssize_t i = 0; i < _neurons.size(); i++) {
-            PyObject* ob = PySequence_GetItem(noise, i);
-            if (!ob) {
-                throw PythonError();
-            }
-            double current = PyFloat_AsDouble(ob);
-            Py_DECREF(ob);
-            if (PyErr_Occurred()) {
-                throw PythonError();
-            }
-            _neurons[i].add_current(current);
-        }
+        add_noise(noise);
     }
     catch (PythonError) {
             return 0;
     }
-	return advance(input);
+	return advance_step(input, output);
+}
+
+// In event-driven mode, advances the potentials analytically over the steps
+// with the same input in which no neuron fires, up to n steps. Returns the
+// number of steps skipped, after which a neuron may fire. Only possible
+// without noise and if no neuron fired in the last step.
+Py_ssize_t Network::skip_silent(const std::vector<double>& input, Py_ssize_t n) {
+	if (!_event_driven || _noise_sigma > 0 || n <= 1) {
+		return 0;
+	}
+	for (Py_ssize_t i = 0; i < _neurons; i++) {
+		if (_fired[i]) {
+			return 0;
+		}
+	}
+	Py_ssize_t steps = n;
+	for (Py_ssize_t i = 0; i < _neurons && steps > 0; i++) {
+		double current = _current[i] + (i < _input_neurons ? input[i] : 0);
+		steps = _model.silent_steps(_potential[i], current, steps);
+	}
+	if (steps > 0) {
+		double decay = std::pow(_model.get_expinvtau(), static_cast<double>(steps));
+		for (Py_ssize_t i = 0; i < _neurons; i++) {
+			double current = _current[i] + (i < _input_neurons ? input[i] : 0);
+			_potential[i] = _model.decay(_potential[i], current, decay);
+		}
+	}
+	return steps;
+}
+
+// Advances from time t to end with the same input. If record is set and no
+// output was stored, stores the output neurons that fired first as a bit
+// mask and the time they fired in rt. Returns false if it stopped there
+// because of stop_on_output.
+bool Network::run_interval(const std::vector<double>& input, Py_ssize_t t,
+		Py_ssize_t end, bool record, bool stop_on_output, long& output,
+		Py_ssize_t& rt) {
+	while (t < end) {
+		t += skip_silent(input, end - t);
+		if (t == end) {
+			break;
+		}
+		add_native_noise();
+		add_input(input);
+		propagate();
+		update_neurons();
+		if (record && !output) {
+			output = output_mask();
+			if (output) {
+				rt = t;
+				if (stop_on_output) {
+					return false;
+				}
+			}
+		}
+		t++;
+	}
+	return true;
+}
+
+// Runs a whole trial, returns the output neurons that fired first as a bit
+// mask (0 if no output neuron fired) and stores the time they fired in rt
+long Network::simulate_trial(Py_ssize_t pre_time,
+		const std::vector<double>& cue_input, Py_ssize_t cue_onset,
+		const std::vector<double>& target_input, Py_ssize_t max_rt,
+		bool stop_on_output, Py_ssize_t& rt) {
+	std::vector<double> input(_input_neurons, 0);
+	long output = 0;
+	reset();
+	run_interval(input, 0, pre_time, false, false, output, rt);
+	for (Py_ssize_t i = 0; i < _input_neurons; i++) {
+		input[i] = cue_input[i] + target_input[i];
+	}
+	if (run_interval(cue_input, -cue_onset, 0, true, stop_on_output, output, rt)) {
+		run_interval(input, 0, max_rt + 1, true, stop_on_output, output, rt);
+	}
+	return output;
+}
+
+PyObject* Network::run_trial(Py_ssize_t pre_time, PyObject* cue,
+		Py_ssize_t cue_onset, PyObject* target, Py_ssize_t max_rt,
+		bool stop_on_output)
+try {
+	std::vector<double> cue_input;
+	std::vector<double> target_input;
+	read_input(cue, cue_input);
+	read_input(target, target_input);
+	Py_ssize_t rt;
+	long mask;
+	Py_BEGIN_ALLOW_THREADS
+	mask = simulate_trial(pre_time, cue_input, cue_onset, target_input,
+			max_rt, stop_on_output, rt);
+	Py_END_ALLOW_THREADS
+	if (!mask) {
+		return Py_BuildValue("(OO)", Py_None, Py_None);
+	}
+	PyObject* output = PyList_New(_output_neurons);
+	if (!output) {
+		return 0;
+	}
+	for (Py_ssize_t i = 0; i < _output_neurons; i++) {
+		PyObject* o = (mask & (1L << i)) ? Py_True : Py_False;
+		Py_INCREF(o);
+		PyList_SET_ITEM(output, i, o);
+	}
+	return Py_BuildValue("(nN)", rt, output);
+}
+catch (PythonError) {
+	return 0;
+}
+
+PyObject* Network::run_trials(Py_ssize_t pre_time, PyObject* cues,
+		PyObject* cue_onsets, PyObject* targets, Py_ssize_t max_rt)
+try {
+	Py_ssize_t trials = PySequence_Size(cues);
+	if (trials < 0) {
+		throw PythonError();
+	}
+	if (PySequence_Size(cue_onsets) != trials || PySequence_Size(targets) != trials) {
+		PyErr_SetString(PyExc_ValueError, "Trial sequences have different lengths");
+		throw PythonError();
+	}
+	std::vector<std::vector<double> > cue_inputs(trials);
+	std::vector<std::vector<double> > target_inputs(trials);
+	std::vector<Py_ssize_t> onsets(trials);
+	for (Py_ssize_t i = 0; i < trials; i++) {
+		PyObject* cue = PySequence_GetItem(cues, i);
+		if (!cue) {
+			throw PythonError();
+		}
+		try {
+			read_input(cue, cue_inputs[i]);
+		}
+		catch (PythonError) {
+			Py_DECREF(cue);
+			throw;
+		}
+		Py_DECREF(cue);
+		PyObject* target = PySequence_GetItem(targets, i);
+		if (!target) {
+			throw PythonError();
+		}
+		try {
+			read_input(target, target_inputs[i]);
+		}
+		catch (PythonError) {
+			Py_DECREF(target);
+			throw;
+		}
+		Py_DECREF(target);
+		PyObject* onset = PySequence_GetItem(cue_onsets, i);
+		if (!onset) {
+			throw PythonError();
+		}
+		onsets[i] = PyNumber_AsSsize_t(onset, PyExc_OverflowError);
+		Py_DECREF(onset);
+		if (PyErr_Occurred()) {
+			throw PythonError();
+		}
+	}
+	std::vector<Py_ssize_t> rts(trials);
+	std::vector<long> outputs(trials);
+	Py_BEGIN_ALLOW_THREADS
+	for (Py_ssize_t i = 0; i < trials; i++) {
+		outputs[i] = simulate_trial(pre_time, cue_inputs[i], onsets[i],
+				target_inputs[i], max_rt, true, rts[i]);
+	}
+	Py_END_ALLOW_THREADS
+	PyObject* pyrts = PyList_New(trials);
+	if (!pyrts) {
+		throw PythonError();
+	}
+	PyObject* pyoutputs = PyList_New(trials);
+	if (!pyoutputs) {
+		Py_DECREF(pyrts);
+		throw PythonError();
+	}
+	for (Py_ssize_t i = 0; i < trials; i++) {
+		PyObject* rt;
+		if (outputs[i]) {
+			rt = PyLong_FromSsize_t(rts[i]);
+		}
+		else {
+			rt = Py_None;
+			Py_INCREF(rt);
+		}
+		PyObject* output = PyLong_FromLong(outputs[i]);
+		if (!rt || !output) {
+			Py_XDECREF(rt);
+			Py_XDECREF(output);
+			Py_DECREF(pyrts);
+			Py_DECREF(pyoutputs);
+			throw PythonError();
+		}
+		PyList_SET_ITEM(pyrts, i, rt);
+		PyList_SET_ITEM(pyoutputs, i, output);
+	}
+	return Py_BuildValue("(NN)", pyrts, pyoutputs);
+}
+catch (PythonError) {
+	return 0;
 }
 
 PyObject* Network::get_potentials() const
 try {
-	PyObject* potentials = PyTuple_New(_neurons.size());
-	Py_ssize_t i = 0;
-	for (std::vector<Neuron>::const_iterator n = _neurons.begin(); n != _neurons.end(); n++) {
-		PyObject* potential = PyFloat_FromDouble(n->potential());
+	PyObject* potentials = PyTuple_New(_neurons);
+	for (Py_ssize_t i = 0; i < _neurons; i++) {
+		PyObject* potential = PyFloat_FromDouble(_potential[i]);
 		PyTuple_SET_ITEM(potentials, i, potential);
-		i++;
 	}
 	return potentials;
 }
@@ -230,13 +514,11 @@ catch (PythonError) {
 
 PyObject* Network::get_spikes() const
 try {
-	PyObject* spikes = PyTuple_New(_neurons.size());
-	Py_ssize_t i = 0;
-	for (std::vector<Neuron>::const_iterator n = _neurons.begin(); n != _neurons.end(); n++) {
-		PyObject* spike = (n->has_fired() ? Py_True : Py_False);
+	PyObject* spikes = PyTuple_New(_neurons);
+	for (Py_ssize_t i = 0; i < _neurons; i++) {
+		PyObject* spike = (_fired[i] ? Py_True : Py_False);
 		Py_INCREF(spike);
 		PyTuple_SET_ITEM(spikes, i, spike);
-		i++;
 	}
 	return spikes;
 }
@@ -245,7 +527,9 @@ catch (PythonError) {
 }
 
 void Network::reset() {
-	for (std::vector<Neuron>::iterator n = _neurons.begin(); n != _neurons.end(); n++) {
-		n->reset();
+	for (Py_ssize_t i = 0; i < _neurons; i++) {
+		_potential[i] = _model.reset_potential();
+		_fired[i] = false;
+		_current[i] = _bias[i];
 	}
 }
@@ -19,64 +19,62 @@
 #define NN_HPP
 
 #include <Python.h>
+#include <cmath>
 #include <vector>
+#include <random>
 
 namespace iznn {
 
+// Parameters of the leaky integrate-and-fire neurons, which are the same for
+// all neurons in a network
 class Neuron {
 public:
 	Neuron() {
 	}
-	Neuron(double bias, double tau, double vrest = -65,
-		   double vreset = -65, double vt = -40);
-	void advance();
-	void reset();
-	inline double potential() const {
-		return _v;
+	Neuron(double tau, double vrest = -65, double vreset = -65, double vt = -40);
+	// Advances the potential v in 1 ms, returns if the neuron fired
+	inline bool advance(double& v, double current) const {
+		v = _vrest + (v - _vrest) * _expinvtau + current;
+		if (v >= _vt) {
+			v = _vreset;
+			return true;
+		}
+		return false;
 	}
-	inline double bias() const {
-		return _bias;
+	inline double reset_potential() const {
+		return _vreset;
 	}
-	inline bool has_fired() const {
-		return _has_fired;
+	// Number of steps, up to n, in which the neuron certainly does not fire
+	// with a constant current. With a constant current, v decays
+	// exponentially towards vinf = vrest + current / (1 - expinvtau).
+	inline Py_ssize_t silent_steps(double v, double current, Py_ssize_t n) const {
+		double vinf = _vrest + current / (1 - _expinvtau);
+		// Lower threshold, to allow for the rounding errors of stepping
+		double vt = _vt - THRESHOLD_MARGIN;
+		if (vinf < vt || v >= vinf) {
+			return n;
+		}
+		if (v >= vt) {
+			return 0;
+		}
+		// First step k with vinf + (v - vinf) * expinvtau^k >= vt
+		double k = std::ceil(std::log((vinf - vt) / (vinf - v)) / std::log(_expinvtau));
+		return k - 1 < n ? static_cast<Py_ssize_t>(k) - 1 : n;
 	}
-	inline void add_current(double current) {
-		_current += current;
+	// Potential after k steps with a constant current, given decay = expinvtau^k
+	inline double decay(double v, double current, double decay) const {
+		double vinf = _vrest + current / (1 - _expinvtau);
+		return vinf + (v - vinf) * decay;
 	}
-	inline double current() const {
-		return _current;
+	inline double get_expinvtau() const {
+		return _expinvtau;
 	}
 private:
+	static constexpr double THRESHOLD_MARGIN = 1e-6;
 	double _expinvtau;
 	double _vrest;
 	double _vreset;
 	double _vt;
-	double _bias;
-	double _v;
-	bool _has_fired;
-	double _current;
-};
-
-class Synapse {
-public:
-	Synapse() {
-	}
-	Synapse(Neuron* source, Neuron* dest, double weight) :
-		_weight(weight), _source(source), _dest(dest) {
-	}
-	inline double advance() {
-		if (_source->has_fired()) {
-			_dest->add_current(_weight);
-			return _weight;
-		}
-		else {
-			return 0;
-		}
-	}
-private:
-	double _weight;
-	Neuron* _source;
-	Neuron* _dest;
 };
 
 class Network {
@@ -89,25 +87,63 @@ public:
 		}
 		const char* msg;
 	};
-	PyObject* advance(PyObject* input);
+	PyObject* advance(PyObject* input, PyObject* output = 0);
 	PyObject* advance_with_current(PyObject* input, double total_current = 0);
 	PyObject* advance_with_current_and_noise(PyObject* input, PyObject* noise);
-	PyObject* advance_with_noise(PyObject* input, PyObject* noise);
+	PyObject* advance_with_noise(PyObject* input, PyObject* noise, PyObject* output = 0);
+	PyObject* run_trial(Py_ssize_t pre_time, PyObject* cue, Py_ssize_t cue_onset,
+			PyObject* target, Py_ssize_t max_rt, bool stop_on_output = true);
+	PyObject* run_trials(Py_ssize_t pre_time, PyObject* cues, PyObject* cue_onsets,
+			PyObject* targets, Py_ssize_t max_rt);
+	void set_noise(double sigma, unsigned long long seed);
+	void set_event_driven(bool event_driven) { _event_driven = event_driven; }
 	PyObject* get_potentials() const;
 	PyObject* get_spikes() const;
 	void reset();
 	Py_ssize_t get_num_input_neurons() const { return _input_neurons; }
 	Py_ssize_t get_num_output_neurons() const { return _output_neurons; }
-	Py_ssize_t get_num_neurons() const { return _neurons.size(); }
+	Py_ssize_t get_num_neurons() const { return _neurons; }
 private:
 	class PythonError {};
 	void add_input(PyObject* input);
-	PyObject* advance_neurons();
-	static const double ACTION_POTENTIAL_CURRENT = 80;
-	std::vector<Neuron> _neurons;
+	void add_input(const std::vector<double>& input);
+	void read_input(PyObject* input, std::vector<double>& values) const;
+	void add_noise(PyObject* noise);
+	void add_native_noise();
+	PyObject* advance_step(PyObject* input, PyObject* output);
+	static void read_values(PyObject* ob, double* values, Py_ssize_t n);
+	void propagate();
+	void update_neurons();
+	long output_mask() const;
+	PyObject* get_output(PyObject* output = 0) const;
+	Py_ssize_t skip_silent(const std::vector<double>& input, Py_ssize_t n);
+	bool run_interval(const std::vector<double>& input, Py_ssize_t t,
+			Py_ssize_t end, bool record, bool stop_on_output, long& output,
+			Py_ssize_t& rt);
+	long simulate_trial(Py_ssize_t pre_time, const std::vector<double>& cue_input,
+			Py_ssize_t cue_onset, const std::vector<double>& target_input,
+			Py_ssize_t max_rt, bool stop_on_output, Py_ssize_t& rt);
+	static constexpr double ACTION_POTENTIAL_CURRENT = 80;
+	Neuron _model;
+	Py_ssize_t _neurons;
 	Py_ssize_t _input_neurons;
 	Py_ssize_t _output_neurons;
-	std::vector<Synapse> _synapses;
+	// Neuron state
+	std::vector<double> _potential;
+	std::vector<double> _current;
+	std::vector<double> _bias;
+	std::vector<char> _fired;
+	// Synaptic weights, _weights[pre * _neurons + post]
+	std::vector<double> _weights;
+	// Buffers for inputs and noise read from Python
+	std::vector<double> _input;
+	std::vector<double> _noise;
+	// Gaussian noise added to every neuron in every step
+	double _noise_sigma;
+	std::mt19937_64 _generator;
+	std::normal_distribution<double> _gauss;
+	// Whether trials skip the steps in which no neuron fires
+	bool _event_driven;
 };
 
 }
@@ -62,10 +62,11 @@ int Network_init(NetworkObject* self, PyObject* args, PyObject* kwds) {
 
 PyObject* Network_advance(NetworkObject* self, PyObject* args) {
 	PyObject* inputs;
-	if (!PyArg_ParseTuple(args, "O", &inputs)) {
+	PyObject* output = 0;
+	if (!PyArg_ParseTuple(args, "O|O", &inputs, &output)) {
 		return 0;
 	}
-	return self->n->advance(inputs);
+	return self->n->advance(inputs, output);
 }
 
 PyObject* Network_advance_with_current(NetworkObject* self, PyObject* args) {
@@ -88,10 +89,70 @@ PyObject* Network_advance_with_current_and_noise(NetworkObject* self, PyObject*
 PyObject* Network_advance_with_noise(NetworkObject* self, PyObject* args) {
 	PyObject* inputs;
 	PyObject* noise;
-	if (!PyArg_ParseTuple(args, "OO", &inputs, &noise)) {
+	PyObject* output = 0;
+	if (!PyArg_ParseTuple(args, "OO|O", &inputs, &noise, &output)) {
+		return 0;
+	}
+	return self->n->advance_with_noise(inputs, noise, output);
+}
+
+PyObject* Network_run_trial(NetworkObject* self, PyObject* args, PyObject* kwds) {
+	Py_ssize_t pre_time;
+	PyObject* cue;
+	Py_ssize_t cue_onset;
+	PyObject* target;
+	Py_ssize_t max_rt;
+	int stop_on_output = 1;
+
+	static char *kwlist[] = { "pre_time", "cue", "cue_onset", "target",
+			"max_rt", "stop_on_output", 0 };
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwds, "nOnOn|p", kwlist,
+			&pre_time, &cue, &cue_onset, &target, &max_rt, &stop_on_output)) {
+		return 0;
+	}
+	return self->n->run_trial(pre_time, cue, cue_onset, target, max_rt,
+			stop_on_output);
+}
+
+PyObject* Network_run_trials(NetworkObject* self, PyObject* args, PyObject* kwds) {
+	Py_ssize_t pre_time;
+	PyObject* cues;
+	PyObject* cue_onsets;
+	PyObject* targets;
+	Py_ssize_t max_rt;
+
+	static char *kwlist[] = { "pre_time", "cues", "cue_onsets", "targets",
+			"max_rt", 0 };
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwds, "nOOOn", kwlist,
+			&pre_time, &cues, &cue_onsets, &targets, &max_rt)) {
+		return 0;
+	}
+	return self->n->run_trials(pre_time, cues, cue_onsets, targets, max_rt);
+}
+
+PyObject* Network_set_noise(NetworkObject* self, PyObject* args) {
+	double sigma;
+	unsigned long long seed;
+	if (!PyArg_ParseTuple(args, "dK", &sigma, &seed)) {
+		return 0;
+	}
+	if (sigma < 0) {
+		PyErr_SetString(PyExc_ValueError, "Noise sigma must not be negative");
 		return 0;
 	}
-	return self->n->advance_with_noise(inputs, noise);
+	self->n->set_noise(sigma, seed);
+	Py_RETURN_NONE;
+}
+
+PyObject* Network_set_event_driven(NetworkObject* self, PyObject* args) {
+	int event_driven;
+	if (!PyArg_ParseTuple(args, "p", &event_driven)) {
+		return 0;
+	}
+	self->n->set_event_driven(event_driven);
+	Py_RETURN_NONE;
 }
 
 PyObject* Network_reset(NetworkObject* self) {
@@ -121,7 +182,7 @@ PyObject* Network_get_spikes(NetworkObject* self) {
 
 PyMethodDef network_methods[] = { { "advance",
 		reinterpret_cast<PyCFunction>(Network_advance), METH_VARARGS,
-		"Advances time in 1 ms, returns output." }, { "reset",
+		"Advances time in 1 ms, returns output or fills the optional output buffer." }, { "reset",
 		reinterpret_cast<PyCFunction>(Network_reset), METH_NOARGS,
 		"Resets all state variables." },
 		{ "advance_with_current",
@@ -132,7 +193,15 @@ PyMethodDef network_methods[] = { { "advance",
 		"Advances time in 1 ms, returns (current, output)." },
 		{ "advance_with_noise",
 		reinterpret_cast<PyCFunction>(Network_advance_with_noise), METH_VARARGS,
-		"Advances time in 1 ms, returns output." }, { "num_input_neurons",
+		"Advances time in 1 ms, returns output or fills the optional output buffer." }, { "run_trial",
+		reinterpret_cast<PyCFunction>(Network_run_trial), METH_VARARGS | METH_KEYWORDS,
+		"Resets the network and runs a whole trial, returns (rt, output)." }, { "run_trials",
+		reinterpret_cast<PyCFunction>(Network_run_trials), METH_VARARGS | METH_KEYWORDS,
+		"Runs a list of trials, returns (rts, outputs)." }, { "set_noise",
+		reinterpret_cast<PyCFunction>(Network_set_noise), METH_VARARGS,
+		"Adds Gaussian noise with standard deviation sigma to every neuron in every step, drawn from a generator with the given seed." }, { "set_event_driven",
+		reinterpret_cast<PyCFunction>(Network_set_event_driven), METH_VARARGS,
+		"If true, trials without noise skip the steps in which no neuron fires, computing the potentials analytically." }, { "num_input_neurons",
 		reinterpret_cast<PyCFunction>(Network_num_input_neurons), METH_NOARGS,
 		"Returns the number of input neurons." }, { "num_output_neurons",
 		reinterpret_cast<PyCFunction>(Network_num_output_neurons), METH_NOARGS,
@@ -0,0 +1,178 @@
+#Copyright 2014, 2015 Carolina Feher da Silva
+#
+#This file is part of rtexp.
+#
+#rtexp is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#rtexp is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
+
+# Networks of integrate-and-fire neurons simulated with NumPy, an alternative
+# to the ifnn extension. The networks of all individuals in a population are
+# advanced in lockstep, and give the same results as ifnn given the same noise.
+
+import math
+import numpy as np
+
+class Population:
+    # Networks of a population of individuals
+    # parameters: one row of genes (biases, then weights) per individual
+    def __init__(self, input_neurons, output_neurons, hidden_neurons,
+                 parameters, tau = 10, vrest = -65, vreset = -65, vt = -40):
+        if input_neurons <= 0:
+            raise AttributeError("Bad number of input neurons")
+        if output_neurons <= 0:
+            raise AttributeError("Bad number of output neurons")
+        if hidden_neurons < 0:
+            raise AttributeError("Bad number of hidden neurons")
+        n = input_neurons + output_neurons + hidden_neurons
+        parameters = np.array(parameters, dtype = float, ndmin = 2)
+        if parameters.shape[1] != n + n * n:
+            raise AttributeError("Bad number of parameters")
+        self.input_neurons = input_neurons
+        self.output_neurons = output_neurons
+        self.neurons = n
+        self.bias = parameters[:, :n]
+        # weights[individual, pre, post]
+        self.weights = parameters[:, n:].reshape(-1, n, n)
+        self.expinvtau = math.exp(-1 / tau)
+        self.vrest = vrest
+        self.vreset = vreset
+        self.vt = vt
+        self.reset()
+    def __len__(self):
+        return len(self.bias)
+    def reset(self):
+        self.potential = np.full(self.bias.shape, float(self.vreset))
+        self.current = self.bias.copy()
+        self.fired = np.zeros(self.bias.shape, dtype = bool)
+    def advance(self, inputs, noise = None):
+        # Advances time in 1 ms, returns which output neurons fired
+        # inputs: input currents, one row per individual or the same for all
+        # noise: noise currents, one row per individual
+        if noise is not None:
+            self.current += noise
+        self.current[:, :self.input_neurons] += inputs
+        # Add the rows of the neurons that fired in the same order as ifnn
+        for pre in np.flatnonzero(self.fired.any(axis = 0)):
+            self.current += self.fired[:, pre, None] * self.weights[:, pre, :]
+        self.potential = self.vrest + (self.potential - self.vrest) * \
+            self.expinvtau + self.current
+        self.fired = self.potential >= self.vt
+        self.potential[self.fired] = self.vreset
+        self.current = self.bias.copy()
+        return self.fired[:, -self.output_neurons:]
+    def output_mask(self):
+        output = self.fired[:, -self.output_neurons:]
+        return (output << np.arange(self.output_neurons)).sum(axis = 1)
+    def repeat(self, repeats):
+        # Returns the networks with each individual repeated
+        pop = Population.__new__(Population)
+        vars(pop).update(vars(self))
+        pop.bias = np.repeat(self.bias, repeats, axis = 0)
+        pop.weights = np.repeat(self.weights, repeats, axis = 0)
+        pop.reset()
+        return pop
+    def run_trials(self, pre_time, cues, cue_onsets, targets, max_rt,
+                   noise_sigma = 0, rng = None, shared_noise = False):
+        # Runs a list of trials for every individual, all trials in lockstep
+        # cue_onsets: one row of cue onset times per individual, or one row for all
+        # shared_noise: the same noise in each trial for every individual
+        # Returns (rts, outputs) arrays, outputs is 0 where there was no response
+        shape = (len(self), len(cues))
+        cues = np.tile(np.asarray(cues, dtype = float), (len(self), 1))
+        targets = np.tile(np.asarray(targets, dtype = float), (len(self), 1))
+        t = -np.broadcast_to(np.asarray(cue_onsets), shape).flatten()
+        rts = np.zeros(t.shape, dtype = int)
+        outputs = np.zeros(t.shape, dtype = int)
+        if noise_sigma and rng is None:
+            rng = np.random.default_rng()
+        trials = self.repeat(shape[1])
+        copies = len(self) if shared_noise else 1
+        no_input = np.zeros(self.input_neurons)
+        for i in range(pre_time):
+            trials.advance(no_input, trials.noise(noise_sigma, rng, copies))
+        done = np.zeros(t.shape, dtype = bool)
+        while not done.all():
+            inputs = cues + (t >= 0)[:, None] * targets
+            trials.advance(inputs, trials.noise(noise_sigma, rng, copies))
+            output = trials.output_mask()
+            responded = ~done & (output != 0)
+            rts[responded] = t[responded]
+            outputs[responded] = output[responded]
+            t += 1
+            done |= responded | (t > max_rt)
+        return rts.reshape(shape), outputs.reshape(shape)
+    def noise(self, noise_sigma, rng, copies = 1):
+        # With copies > 1, the noise is drawn for the first len(self) // copies
+        # networks and repeated for the others
+        if not noise_sigma:
+            return None
+        if copies == 1:
+            return rng.normal(0, noise_sigma, self.bias.shape)
+        return np.tile(rng.normal(0, noise_sigma,
+                                  (len(self) // copies, self.neurons)), (copies, 1))
+
+class Network:
+    # Same interface as ifnn.Network
+    def __init__(self, input_neurons, output_neurons, hidden_neurons,
+                 parameters, tau = 10):
+        self._pop = Population(input_neurons, output_neurons, hidden_neurons,
+                               [parameters], tau)
+        self._noise_sigma = 0
+        self._rng = None
+    def set_noise(self, sigma, seed):
+        if sigma < 0:
+            raise ValueError("Noise sigma must not be negative")
+        self._noise_sigma = sigma
+        self._rng = np.random.default_rng(seed)
+    def set_event_driven(self, event_driven):
+        # All steps are simulated, in lockstep with the other networks
+        pass
+    def advance(self, inputs, output = None):
+        noise = self._pop.noise(self._noise_sigma, self._rng)
+        return self._output(self._pop.advance(inputs, noise)[0], output)
+    def advance_with_noise(self, inputs, noise, output = None):
+        return self._output(self._pop.advance(inputs, np.asarray(noise)[None, :])[0],
+                            output)
+    @staticmethod
+    def _output(fired, output):
+        if output is None:
+            return fired.tolist()
+        output[:len(fired)] = fired.tolist()
+        return output
+    def run_trial(self, pre_time, cue, cue_onset, target, max_rt,
+                  stop_on_output = True):
+        rts, outputs = self._pop.run_trials(pre_time, [cue], [cue_onset],
+                                            [target], max_rt,
+                                            self._noise_sigma, self._rng)
+        if not outputs[0, 0]:
+            return None, None
+        return int(rts[0, 0]), [bool(outputs[0, 0] & (1 << i))
+                                for i in range(self._pop.output_neurons)]
+    def run_trials(self, pre_time, cues, cue_onsets, targets, max_rt):
+        rts, outputs = self._pop.run_trials(pre_time, cues, cue_onsets,
+                                            targets, max_rt,
+                                            self._noise_sigma, self._rng)
+        return ([int(rt) if output else None for rt, output in zip(rts[0], outputs[0])],
+                outputs[0].tolist())
+    def reset(self):
+        self._pop.reset()
+    def num_input_neurons(self):
+        return self._pop.input_neurons
+    def num_output_neurons(self):
+        return self._pop.output_neurons
+    def num_neurons(self):
+        return self._pop.neurons
+    def get_potentials(self):
+        return tuple(self._pop.potential[0].tolist())
+    def get_spikes(self):
+        return tuple(self._pop.fired[0].tolist())
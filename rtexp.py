@@ -15,7 +15,11 @@
 #You should have received a copy of the GNU General Public License
 #along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
 
-import random, math, sys, os, ifnn, time, ga, configparser
+import random, math, sys, os, time, ga, configparser, types, contextlib
+import collections, statistics
+from array import array
+import numpy
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Read experiment configuration
 config = configparser.ConfigParser()
@@ -41,15 +45,45 @@ MIGRAR = int(config['MIGRAR'])
 MAX_STAGNATION = int(config['MAX_STAGNATION'])
 NOISE = int(config['NOISE'])
 NOISE_SIGMA = float(config['NOISE_SIGMA'])
+# Noise drawn by the network simulator (native) or in every step by Python
+NOISE_SOURCE = config.get('NOISE_SOURCE', 'native')
+# Skip the steps in which no neuron fires, only without noise
+EVENT_DRIVEN = int(config.get('EVENT_DRIVEN', 0))
+SEED = config.get('SEED')
 DIR = config['DIR']
+# Network simulator (ifnn or numpy)
+BACKEND = config.get('BACKEND', 'ifnn')
+if BACKEND == 'numpy':
+    import npnn
+    Network = npnn.Network
+else:
+    assert BACKEND == 'ifnn'
+    import ifnn
+    Network = ifnn.Network
+# Stop evaluating individuals that can no longer beat the elite, evaluated
+# on the same schedule. They get fitness 0, so they lose every tournament,
+# which changes the course of evolution (see README.md)
+PRUNE = int(config.get('PRUNE', 0))
+# Racing: run the trials in batches of RACE_BATCH, and stop evaluating an
+# individual as soon as the confidence interval of its fitness is below the
+# fitness of the elite (not supported by BACKEND = numpy)
+RACING = int(config.get('RACING', 0))
+RACE_BATCH = int(config.get('RACE_BATCH', 10))
+RACE_CONFIDENCE = float(config.get('RACE_CONFIDENCE', 0.95))
+if BACKEND == 'numpy' and (PRUNE or RACING):
+    # PopulationEvaluator runs every trial of every individual
+    sys.stderr.write('BACKEND = numpy runs all trials, not pruning or racing.\n')
+    PRUNE = RACING = 0
 FILENAME = os.path.join(DIR, 'r%03d-g%03d')
 
 def advance_nn(self, nn, s):
-    return nn.advance(s)
+    return nn.advance(s, self.output)
 
 def advance_nn_with_noise(self, nn, s):
-    noise = [random.gauss(0, NOISE_SIGMA) for i in range(nn.num_neurons())]
-    return nn.advance_with_noise(s, noise)
+    noise = self.noise
+    for i in range(len(noise)):
+        noise[i] = self.rng.gauss(0, NOISE_SIGMA)
+    return nn.advance_with_noise(s, noise, self.output)
 
 class Task:
     # Time parameters
@@ -60,6 +94,14 @@ class Task:
     
     advance = advance_nn_with_noise if NOISE else advance_nn
     
+    def __init__(self, schedule):
+        self.cue_times = schedule['cue_times'].tolist()
+        if NOISE:
+            self.noise_seeds = schedule['noise_seeds'].tolist()
+        if RACING:
+            self.order = schedule['order'].tolist()
+        self.output = None
+    
     @classmethod
     def define_trials(cls, valid, neutral, invalid, catch, reps):
         cls.trials = (
@@ -78,48 +120,144 @@ class Task:
         ) * round(catch * invalid * 2 * reps) + (
             ('C', 'N'),
         ) * round(catch * neutral * 2 * reps)
+        cls.cue_inputs = tuple(cls.cue_input(side, vcue) for side, vcue in cls.trials)
+        cls.target_inputs = tuple(cls.target_input(side) for side, vcue in cls.trials)
     
-    def run(self, c, nn):
-        results = []
-        for params in self.trials:
-            nn.reset()
-            s = [0] * nn.num_input_neurons()
-            for i in range(self.PRE_TIME):
-                output = self.advance(nn, s)
-            side, vcue = params
-            if vcue == 'N':
-                cue = [0, CUE_STIMULI, 0]
-            elif side == 'L' and vcue == 'V' or side == 'R' and vcue == 'I':
-                cue = [CUE_STIMULI, 0, 0]
+    @staticmethod
+    def cue_input(side, vcue):
+        if vcue == 'N':
+            cue = [0, CUE_STIMULI, 0]
+        elif side == 'L' and vcue == 'V' or side == 'R' and vcue == 'I':
+            cue = [CUE_STIMULI, 0, 0]
+        else:
+            cue = [0, 0, CUE_STIMULI]
+        return [0] + cue + [0]
+    
+    @staticmethod
+    def target_input(side):
+        if side == 'L':
+            return [EXT_STIMULI, 0, 0, 0, 0]
+        elif side == 'R':
+            return [0, 0, 0, 0, EXT_STIMULI]
+        else:
+            assert side == 'C'
+            return [0, 0, 0, 0, 0]
+    
+    def run_steps(self, nn, side, vcue, cue_time):
+        # Runs a trial one step at a time from Python
+        if self.output is None:
+            # Buffers reused in every step
+            self.input = array('d', [0]) * nn.num_input_neurons()
+            self.noise = array('d', [0]) * nn.num_neurons()
+            self.output = bytearray(nn.num_output_neurons())
+        nn.reset()
+        s = self.input
+        s[:] = array('d', [0]) * len(s)
+        for i in range(self.PRE_TIME):
+            output = self.advance(nn, s)
+        t = -cue_time
+        s[:] = array('d', self.cue_input(side, vcue))
+        target = self.target_input(side)
+        while t <= self.MAX_RT:
+            if t == 0:
+                for i, current in enumerate(target):
+                    s[i] += current
+            assert len(s) == nn.num_input_neurons()
+            output = self.advance(nn, s)
+            if any(output):
+                return t, sum(1 << i for i, o in enumerate(output) if o)
+            t += 1
+        return None, 0
+    
+    def simulate(self, nn, ks):
+        # Runs the trials with indices ks, returns their RTs and outputs
+        if not NOISE:
+            return nn.run_trials(self.PRE_TIME, [self.cue_inputs[k] for k in ks],
+                [self.cue_times[k] for k in ks],
+                [self.target_inputs[k] for k in ks], self.MAX_RT)
+        # The noise of each trial is drawn from its own seed
+        rts = []
+        outputs = []
+        for k in ks:
+            if NOISE_SOURCE == 'python':
+                self.rng = random.Random(self.noise_seeds[k])
+                side, vcue = self.trials[k]
+                rt, output = self.run_steps(nn, side, vcue, self.cue_times[k])
             else:
-                cue = [0, 0, CUE_STIMULI]
-            t = -random.randint(self.MIN_CUE_TIME, self.MAX_CUE_TIME)
-            rt = None
-            s[1:4] = cue
-            while t <= self.MAX_RT:
-                if t == 0:
-                    if side == 'L':
-                        s[0] = EXT_STIMULI
-                    elif side == 'R':
-                        s[4] = EXT_STIMULI
-                    else:
-                        assert side == 'C'
-                assert len(s) == nn.num_input_neurons()
-                output = self.advance(nn, s)
-                result = self.got_result(output, side)
-                if result is not None:
-                    result['params'] = params
-                    result['rt'] = t
-                    results.append(result)
+                nn.set_noise(NOISE_SIGMA, self.noise_seeds[k])
+                (rt,), (output,) = nn.run_trials(self.PRE_TIME,
+                    self.cue_inputs[k:k + 1], self.cue_times[k:k + 1],
+                    self.target_inputs[k:k + 1], self.MAX_RT)
+            rts.append(rt)
+            outputs.append(output)
+        return rts, outputs
+    
+    def run(self, c, nn, bound = None):
+        # If a bound is given, stops when the fitness can no longer reach it
+        if RACING:
+            self.race(c, nn, bound)
+            return
+        if bound is None:
+            rts, outputs = self.simulate(nn, range(len(self.trials)))
+        else:
+            rts = []
+            outputs = []
+            fitness = 0
+            for k, (side, vcue) in enumerate(self.trials):
+                if fitness + self.MAX_SCORE * (len(self.trials) - k) < bound:
                     break
-                else:
-                    t += 1
-            else:
-                result = {}
-                result['params'] = params
-                result['rt'] = None
-                results.append(result)
-        self.set_fitness(c, results)
+                rt, output = self.simulate(nn, [k])
+                rts += rt
+                outputs += output
+                fitness += self.score(side, rt[0], output[0])
+            self.set_skipped(c, range(len(rts), len(self.trials)))
+        self.set_fitness(c, rts, outputs)
+        if len(rts) < len(self.trials):
+            # The lowest fitness, as the partial one would bias selection
+            c.fitness = 0
+    
+    def race(self, c, nn, bound):
+        # Runs the trials in the order of the schedule, RACE_BATCH at a time,
+        # until the confidence interval of the fitness, estimated from the
+        # trials run, is below the bound. The fitness is then the estimate.
+        # Individuals that may beat the bound run all trials, so that the
+        # elite is never an estimate inflated by a lucky start.
+        n = len(self.trials)
+        rts = []
+        outputs = []
+        scores = []
+        while len(rts) < n:
+            ks = self.order[len(rts):len(rts) + RACE_BATCH]
+            rt, output = self.simulate(nn, ks)
+            rts += rt
+            outputs += output
+            scores += [self.score(self.trials[k][0], r, o)
+                       for k, r, o in zip(ks, rt, output)]
+            if bound is not None and len(rts) < n:
+                low, high = fitness_interval(scores, n)
+                if high < bound:
+                    break
+        self.set_fitness(c, rts, outputs,
+                         [self.trials[k] for k in self.order[:len(rts)]])
+        c.fitness *= n / len(rts)
+        self.set_skipped(c, self.order[len(rts):])
+    
+    def set_skipped(self, c, ks):
+        c.skipped_trials = len(ks)
+        # Upper bound for the number of steps not simulated
+        c.skipped_steps = sum(self.PRE_TIME + self.cue_times[k] + self.MAX_RT + 1
+                              for k in ks)
+    
+    # Maximum score of a trial
+    MAX_SCORE = 1000
+    def score(self, side, rt, output):
+        # Contribution of a trial to fitness
+        if rt is None:
+            return self.MAX_SCORE if side == 'C' else 0
+        elif side == 'C' or rt <= 0:
+            return 0
+        else:
+            return self.get_fitness(rt)
     @staticmethod
     def get_fitness(rt):
         return 1000 * math.exp(-0.01 * rt)
@@ -144,13 +282,10 @@ class Task:
         print()
 
 class SimpleRTTask(Task):
-    def got_result(self, output, side):
-        if output[0]:
-            return {}
-        else:
-            return None
-    
-    def set_fitness(self, c, results):
+    def set_fitness(self, c, rts, outputs, trials = None):
+        # trials: the trials of rts and outputs, all trials by default
+        if trials is None:
+            trials = self.trials
         c.fitness = 0
         anticipated = 0
         resp = 0
@@ -159,23 +294,22 @@ class SimpleRTTask(Task):
         rt_valid = []
         rt_invalid = []
         rt_neutral = []
-        for r in results:
-            side, vcue = r['params']
-            if r['rt'] is not None:
+        for (side, vcue), rt, output in zip(trials, rts, outputs):
+            if rt is not None:
                 resp += 1
                 if side == 'C': # responded in a catch trial
                     pass
-                elif r['rt'] <= 0: # anticipated
+                elif rt <= 0: # anticipated
                     anticipated += 1
                 else:
-                    c.fitness += self.get_fitness(r['rt'])
+                    c.fitness += self.get_fitness(rt)
                     if vcue == 'V':
-                        rt_valid.append(r['rt'])
+                        rt_valid.append(rt)
                     elif vcue == 'I':
-                        rt_invalid.append(r['rt'])
+                        rt_invalid.append(rt)
                     else:
                         assert vcue == 'N'
-                        rt_neutral.append(r['rt'])
+                        rt_neutral.append(rt)
             else:
                 if side == 'C':
                     c.fitness += 1000
@@ -188,17 +322,20 @@ class SimpleRTTask(Task):
         c.count = (resp, miss, anticipated, catch)
 
 class ChoiceRTTask(Task):
-    def got_result(self, output, side):
-        if output[0] and output[1]:
-            return {'correct': False}
-        elif output[0]:
-            return {'correct': (side == 'L')}
-        elif output[1]:
-            return {'correct': (side == 'R')}
-        else:
-            return None
+    @staticmethod
+    def is_correct(output, side):
+        # output is a bit mask of the output neurons that fired
+        return output == 1 and side == 'L' or output == 2 and side == 'R'
     
-    def set_fitness(self, c, results):
+    def score(self, side, rt, output):
+        if rt is not None and side != 'C' and not self.is_correct(output, side):
+            return 0
+        return super().score(side, rt, output)
+    
+    def set_fitness(self, c, rts, outputs, trials = None):
+        # trials: the trials of rts and outputs, all trials by default
+        if trials is None:
+            trials = self.trials
         c.fitness = 0
         anticipated = 0
         resp = 0
@@ -208,23 +345,22 @@ class ChoiceRTTask(Task):
         rt_valid = []
         rt_invalid = []
         rt_neutral = []
-        for r in results:
-            side, vcue = r['params']
-            if r['rt'] is not None:
+        for (side, vcue), rt, output in zip(trials, rts, outputs):
+            if rt is not None:
                 resp += 1
                 if side == 'C': # responded in a catch trial
                     pass
-                elif r['rt'] <= 0: # anticipated
+                elif rt <= 0: # anticipated
                     anticipated += 1
-                elif r['correct']:
-                    c.fitness += self.get_fitness(r['rt'])
+                elif self.is_correct(output, side):
+                    c.fitness += self.get_fitness(rt)
                     if vcue == 'V':
-                        rt_valid.append(r['rt'])
+                        rt_valid.append(rt)
                     elif vcue == 'I':
-                        rt_invalid.append(r['rt'])
+                        rt_invalid.append(rt)
                     else:
                         assert vcue == 'N'
-                        rt_neutral.append(r['rt'])
+                        rt_neutral.append(rt)
                 else:
                     wrong += 1
             else:
@@ -244,6 +380,23 @@ def avg(l):
     except:
         return None
 
+def fitness_interval(scores, n):
+    # Normal confidence interval of the sum of the scores of n trials,
+    # estimated from the scores of a sample of them drawn without replacement
+    # (with the finite population correction). The variance is estimated with
+    # two more scores, 0 and MAX_SCORE, so that it does not vanish for small
+    # samples that happen to have the same score.
+    m = len(scores)
+    if m < 2:
+        return -math.inf, math.inf
+    mean = sum(scores) / m
+    padded = scores + [0, Task.MAX_SCORE]
+    padded_mean = sum(padded) / len(padded)
+    var = sum((x - padded_mean) ** 2 for x in padded) / (len(padded) - 1)
+    z = statistics.NormalDist().inv_cdf((1 + RACE_CONFIDENCE) / 2)
+    h = z * math.sqrt(var / m * (n - m) / (n - 1))
+    return n * (mean - h), n * (mean + h)
+
 def median(l):
     if len(l) == 0:
         return None
@@ -253,29 +406,105 @@ def median(l):
     else:
         return l[len(l) // 2]
 
-def simplert_fitness_function(pop):
-    #print('   fitness\tvalidRT\tinvldRT\tneutrRT\tres\tmis\tant\tcat')
-    for c in pop:
-        trials = SimpleRTTask()
-        trials.run(c, make_network(c))
-    #print()
-
-def choicert_fitness_function(pop):
-    #print('   fitness\tvalidRT\tneutrRT\tinvldRT\tres\tmis\tant\twro\tcat')
-    for c in pop:
-        trials = ChoiceRTTask()
-        trials.run(c, make_network(c))
-    #print()
+def draw_schedule(rng):
+    # Trial schedule shared by all individuals of a population in an
+    # evaluation: the cue time and, with noise, the noise seed of each trial.
+    # A dict of arrays, so that checkpoints store it without this module.
+    schedule = {'cue_times': rng.integers(Task.MIN_CUE_TIME, Task.MAX_CUE_TIME,
+                                          len(Task.trials), endpoint = True)}
+    if NOISE:
+        schedule['noise_seeds'] = rng.integers(0, 1 << 64, len(Task.trials),
+                                               dtype = numpy.uint64)
+    if RACING:
+        # Order in which the trials are raced
+        schedule['order'] = rng.permutation(len(Task.trials))
+    return schedule
+
+def simplert_fitness_function(genes, schedule, bound = None):
+    c = types.SimpleNamespace()
+    SimpleRTTask(schedule).run(c, make_network(genes), bound)
+    return vars(c)
+
+def choicert_fitness_function(genes, schedule, bound = None):
+    c = types.SimpleNamespace()
+    ChoiceRTTask(schedule).run(c, make_network(genes), bound)
+    return vars(c)
     
+class PopulationEvaluator(ga.Evaluator):
+    # Simulates the networks of all individuals in lockstep with npnn
+    # (does not support pruning)
+    def map(self, jobs):
+        genes, schedules, bounds = zip(*jobs)
+        # The same schedule for all individuals
+        schedule = schedules[0]
+        task = TASK(schedule)
+        nns = npnn.Population(INPUT_NEURONS, OUTPUT_NEURONS, HIDDEN_NEURONS,
+                              genes, TAU)
+        rng = numpy.random.default_rng(schedule['noise_seeds']) if NOISE else None
+        rts, outputs = nns.run_trials(Task.PRE_TIME, Task.cue_inputs,
+            schedule['cue_times'], Task.target_inputs, Task.MAX_RT,
+            NOISE_SIGMA if NOISE else 0, rng, shared_noise = True)
+        results = []
+        for rt_row, output_row in zip(rts, outputs):
+            c = types.SimpleNamespace()
+            task.set_fitness(c, [int(rt) if output else None
+                                 for rt, output in zip(rt_row, output_row)],
+                             output_row.tolist())
+            results.append(vars(c))
+        return results
+
 if config['TYPE'] == 'Simple':
-    ga.Population.evaluate_fitness = simplert_fitness_function
+    TASK = SimpleRTTask
+    fitness_function = simplert_fitness_function
     #print('Simple RT task selected.')
     OUTPUT_NEURONS = 1
 else:
-    ga.Population.evaluate_fitness = choicert_fitness_function
+    TASK = ChoiceRTTask
+    fitness_function = choicert_fitness_function
     #print('Choice RT task selected.')
     OUTPUT_NEURONS = 2
+# Fitness evaluation backend (serial, process or thread)
+EVALUATOR = config.get('EVALUATOR', 'serial')
+WORKERS = int(config.get('WORKERS', 0))
+# Number of fitness evaluations to cache (0 means no cache)
+CACHE = int(config.get('CACHE', 0))
+# Cache stochastic evaluations too, reusing one estimate per chromosome
+CACHE_STOCHASTIC = int(config.get('CACHE_STOCHASTIC', 0))
+
+def make_evaluator(evaluator):
+    cache_size = CACHE
+    if cache_size and not DETERMINISTIC and not CACHE_STOCHASTIC:
+        sys.stderr.write('Fitness is stochastic, not caching it.\n')
+        cache_size = 0
+    if BACKEND == 'numpy':
+        return PopulationEvaluator(fitness_function, cache_size, draw_schedule)
+    elif evaluator == 'process':
+        return ga.ProcessPoolEvaluator(fitness_function, WORKERS, cache_size,
+                                       draw_schedule)
+    elif evaluator == 'thread':
+        # ifnn releases the GIL while it simulates trials
+        return ga.ThreadPoolEvaluator(fitness_function, WORKERS, cache_size,
+                                      draw_schedule)
+    else:
+        assert evaluator == 'serial'
+        return ga.Evaluator(fitness_function, cache_size, draw_schedule)
 ga.Run.MAX_STAGNATION = MAX_STAGNATION
+# Totals of the evaluations of each generation, reported at every save
+ga.Evaluator.TOTALS = ('skipped_trials', 'skipped_steps')
+ga.Population.HISTORY = SAVE
+# Asynchronous steady-state evolution instead of generations, to keep the
+# workers of parallel evaluators busy
+ga.Run.STEADY_STATE = bool(int(config.get('STEADY_STATE', 0)))
+# Evolve each population in its own process (ISLANDS = 1), or on the island
+# servers at ISLAND_HOSTS ("host:port host:port ..."), which share the
+# ISLAND_AUTHKEY secret
+ISLANDS = int(config.get('ISLANDS', 0))
+ISLAND_HOSTS = [(host, int(port)) for host, port in
+                (address.rsplit(':', 1) for address in config.get('ISLAND_HOSTS', '').split())]
+ISLAND_AUTHKEY = config.get('ISLAND_AUTHKEY', '').encode()
+if ISLAND_HOSTS and not ISLAND_AUTHKEY:
+    sys.stderr.write('ISLAND_HOSTS requires ISLAND_AUTHKEY.\n')
+    sys.exit(-1)
 
 INPUT_NEURONS = 5
 HIDDEN_NEURONS = int(config['HIDDEN_NEURONS'])
@@ -287,19 +516,22 @@ NEUTRAL = int(config['NEUTRAL'])
 CATCH = float(config.get('CATCH', 0))
 REPS = int(config['REPS'])
 Task.MAX_CUE_TIME = int(config.get('MAX_CUE_TIME', 200))
+# Without noise and with a fixed cue time, fitness only depends on the genes
+DETERMINISTIC = not NOISE and Task.MIN_CUE_TIME == Task.MAX_CUE_TIME
+# The elite is evaluated first on each schedule, so it bounds the others
+ga.Evaluator.PRUNE = bool(PRUNE or RACING)
 
 # For the simple GA
 
-def get_list_genes():
-    list_genes = []
-    for i in range(NEURONS):
-        list_genes.append(ga.Gene(MIN_GENE, MAX_GENE, MUTATION_STEP)) # bias
-    for i in range(NEURONS * NEURONS): # synapses
-        list_genes.append(ga.Gene(MIN_GENE, MAX_GENE, MUTATION_STEP))
-    return list_genes
+# Biases, then synapses
+GENOME = ga.Genome.uniform(NEURONS + NEURONS * NEURONS, MIN_GENE, MAX_GENE,
+                           MUTATION_STEP)
 
 def make_network(c):
-    return ifnn.Network(INPUT_NEURONS, OUTPUT_NEURONS, HIDDEN_NEURONS, c, TAU)
+    nn = Network(INPUT_NEURONS, OUTPUT_NEURONS, HIDDEN_NEURONS, c, TAU)
+    if EVENT_DRIVEN and not NOISE:
+        nn.set_event_driven(True)
+    return nn
             
 def friendly_time(t):
     s = []
@@ -316,28 +548,40 @@ def friendly_time(t):
     return ' '.join(s)
     
 def sub_pop(run, i):
-    newpop = ga.Population.get_random(NUM_INDS, get_list_genes())
+    newpop = ga.Population.get_random(NUM_INDS, GENOME)
     run[i] = newpop
 
 Task.define_trials(VALID, NEUTRAL, INVALID, CATCH, REPS)
+ga.Population.evaluate_fitness = make_evaluator(EVALUATOR)
 
-if __name__ == '__main__':
-    if not os.path.exists(DIR):
-        os.mkdir(DIR)
-    for run_number in range(RUNS):
-        print("Run", run_number + 1)
+def run_seed(run_number):
+    # Seed for a new run (None means random)
+    if SEED is None:
+        return None
+    return '%s-%d' % (SEED, run_number)
+
+def make_islands():
+    if ISLAND_HOSTS:
+        return ga.Islands.connect(ISLAND_HOSTS, NUM_POPS, ISLAND_AUTHKEY)
+    elif ISLANDS:
+        return ga.Islands.start(NUM_POPS, init_island)
+    return contextlib.nullcontext()
+
+def evolve(run_number, report):
+    # Evolves a run, resuming from its last checkpoint
+    with make_islands() as islands, ga.CheckpointWriter() as writer:
         arquivo = FILENAME % (run_number, 0)
         if os.path.exists(arquivo):
             with open(arquivo, 'rb') as f:
                 run = ga.Run.load(f)
         else:
+            ga.Run.seed(run_seed(run_number))
             run = ga.Run()
             for i in range(NUM_POPS):
-                pop = ga.Population.get_random(NUM_INDS, get_list_genes())
+                pop = ga.Population.get_random(NUM_INDS, GENOME)
                 run.append(pop)
-            with open(arquivo, 'wb') as f:
-                run.dump(f)
-        print("Generation 0")
+            writer.save(run, arquivo)
+        report(run_number, run.g, run)
         while run.g < GENERATIONS:
             new_g = run.g + SAVE
             arquivo = FILENAME % (run_number, new_g)
@@ -345,10 +589,69 @@ if __name__ == '__main__':
                 with open(arquivo, 'rb') as f:
                     run = ga.Run.load(f)
             else:
-                run.iterate(SAVE)
+                run.iterate(SAVE, islands)
                 assert run.g == new_g
                 if MIGRAR and run.g % MIGRAR == 0:
-                    run.migrate()
-                with open(arquivo, 'wb') as f:
-                    run.dump(f)
-            print("Generation %d" % (run.g))
\ No newline at end of file
+                    run.migrate(islands)
+                writer.save(run, arquivo)
+            report(run_number, run.g, run)
+    return run_number
+
+def generation_totals(run):
+    # Totals of the evaluations of the generations since the last report
+    totals = [collections.Counter() for i in range(ga.Population.HISTORY)]
+    for pop in run:
+        history = getattr(pop, 'history', [])
+        for total, pop_total in zip(totals[len(totals) - len(history):], history):
+            total.update(pop_total)
+    return [total for total in totals if total]
+
+def evaluation_stats(run):
+    stats = []
+    if RACING:
+        stats.append('trials run per generation: %s' % ' '.join(
+            '%d' % (total['evaluations'] * len(Task.trials) - total['skipped_trials'])
+            for total in generation_totals(run)))
+    elif ga.Evaluator.PRUNE:
+        stats.append('trials and up to steps pruned per generation: %s' % ' '.join(
+            '%d/%d' % (total['skipped_trials'], total['skipped_steps'])
+            for total in generation_totals(run)))
+    evaluator = ga.Population.evaluate_fitness
+    if evaluator.cache_size:
+        stats.append('cache: %d hits, %d misses' % (evaluator.hits, evaluator.misses))
+    return ' (%s)' % '; '.join(stats) if stats and run.g else ''
+
+def print_generation(run_number, g, run):
+    print("Generation %d" % g + evaluation_stats(run))
+
+def print_run_generation(run_number, g, run):
+    print("Run %d: Generation %d" % (run_number + 1, g) + evaluation_stats(run),
+          flush = True)
+
+def init_run_worker():
+    # Each worker evolves a whole run, so it evaluates fitness serially
+    ga.Population.evaluate_fitness = make_evaluator('serial')
+
+def init_island():
+    # An evaluator of its own, not the one inherited from the coordinator
+    ga.Population.evaluate_fitness = make_evaluator(EVALUATOR)
+
+if __name__ == '__main__' and sys.argv[2:3] == ['island']:
+    # Island server: python rtexp.py <exp.cfg> island <port>
+    ga.serve_islands(('', int(sys.argv[3])), ISLAND_AUTHKEY, init_island)
+elif __name__ == '__main__':
+    # Optional second argument: number of runs to evolve in parallel
+    JOBS = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    if not os.path.exists(DIR):
+        os.mkdir(DIR)
+    if JOBS == 1:
+        for run_number in range(RUNS):
+            print("Run", run_number + 1)
+            evolve(run_number, print_generation)
+    else:
+        with ProcessPoolExecutor(JOBS, initializer = init_run_worker) as executor:
+            futures = [executor.submit(evolve, run_number, print_run_generation)
+                       for run_number in range(RUNS)]
+            for i, future in enumerate(as_completed(futures)):
+                print("Run %d finished (%d/%d)" % (future.result() + 1, i + 1, RUNS),
+                      flush = True)
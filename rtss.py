@@ -15,45 +15,20 @@
 #You should have received a copy of the GNU General Public License
 #along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
 
-import ga, configparser, os
-
-###
-# Fonte: http://stackoverflow.com/questions/15033511/compute-a-confidence-interval-from-sample-data
 import numpy as np
-import scipy as sp
-import scipy.stats
-
-def mean_confidence_interval(data, confidence=0.95):
-    a = 1.0*np.array(data)
-    n = len(a)
-    m, se = np.mean(a), scipy.stats.sem(a)
-    h = se * sp.stats.t._ppf((1+confidence)/2., n-1)
-    return m, m-h, m+h
 
-###
+import aggregate, confidence
 
 if __name__ == '__main__':
     print('cond', 'exptype', 'cuetype', 'mean', 'ciinf', 'cisup', sep=",")
     for expn in range(3, 9):
-        config = configparser.ConfigParser()
-        config.read('exp%d.cfg' % expn)
-        config = config['EXP']
+        config = aggregate.read_config('exp%d.cfg' % expn)
         g = int(config['GENERATIONS'])
-        ARQUIVO = os.path.join(config['DIR'], 'r%03d-g%03d')
-        vrt, nrt, irt = [], [], []
-        for run_number in range(int(config['RUNS'])):
-            arquivo = ARQUIVO % (run_number, g)
-            assert os.path.exists(arquivo)
-            with open(arquivo, 'rb') as f:
-                run = ga.Run.load(f)
-            for pop in run:
-                for ind in pop:
-                    if ind.rt_valid is not None:
-                        vrt.append(ind.rt_valid)
-                    if ind.rt_neutral is not None:
-                        nrt.append(ind.rt_neutral)
-                    if ind.rt_invalid is not None:
-                        irt.append(ind.rt_invalid)
-        for cue_type, data in (('Valid', vrt), ('Neutral', nrt), ('Invalid', irt)):
-            mean, ciinf, cisup = mean_confidence_interval(data)
-            print('cond%d' % ((expn + 1) // 2), 'SRT' if config['TYPE'] == 'Simple' else 'CRT', cue_type, mean, ciinf, cisup, sep=",")
\ No newline at end of file
+        table = aggregate.load_table(config)
+        final = table['g'] == g
+        assert len(np.unique(table['run'][final])) == int(config['RUNS'])
+        final &= aggregate.evaluated(table)
+        for cue_type, column in (('Valid', 'rt_valid'), ('Neutral', 'rt_neutral'), ('Invalid', 'rt_invalid')):
+            data = table[column][final]
+            mean, ciinf, cisup = confidence.mean_confidence_interval(data[~np.isnan(data)])
+            print('cond%d' % ((expn + 1) // 2), 'SRT' if config['TYPE'] == 'Simple' else 'CRT', cue_type, mean, ciinf, cisup, sep=",")
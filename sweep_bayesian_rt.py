@@ -0,0 +1,113 @@
+#Copyright 2014, 2015 Carolina Feher da Silva
+#
+#This file is part of rtexp.
+#
+#rtexp is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#rtexp is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs the sensory model experiments for a grid of parameters, writing the
+# mean RTs to a CSV file in the format of anabayes.csv. Grid points already
+# in the file are skipped, so an interrupted sweep can be resumed.
+
+import sys, os, itertools, zlib, configparser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from exp_bayesian_rt import run_trials
+from confidence import mean_confidence_interval
+
+HEADER = 'exptype,cuetype,gamma,signal,rt,ciinf,cisup'
+CUE_TYPES = ('Valid', 'Neutral', 'Invalid')
+
+# Parameters of a grid point, in the order run_trials takes them
+PARAMETERS = ('EXP_TYPE', 'REPS', 'S', 'SIGMA', 'TMAX', 'R', 'ACMIN')
+TYPES = (str, int, float, float, int, float, float)
+
+def read_grid(filename):
+    # Each section of the file is a grid, each parameter a list of values,
+    # for instance "ACMIN = 0.8 0.95". Returns the grid points and the seed.
+    # Raises ValueError if two points would have the same rows in the CSV file.
+    config = configparser.ConfigParser()
+    config.read(filename)
+    points = {}
+    for section in config.sections():
+        values = [[t(v) for v in config[section][p].split()]
+                  for p, t in zip(PARAMETERS, TYPES)]
+        for point in itertools.product(*values):
+            other = points.setdefault(point_key(point), point)
+            if other != point:
+                raise ValueError('Grid points %s and %s differ only in parameters '
+                                 'not in the output' % (other, point))
+    seed = config['DEFAULT'].get('SEED')
+    return list(points.values()), None if seed is None else int(seed)
+
+def key(exptype, gamma, signal):
+    # Grid points are identified in the CSV file by type, accuracy and signal
+    return exptype, float(gamma), float(signal)
+
+def point_key(point):
+    exp_type, REPS, s, sigma, tmax, r, acmin = point
+    return key(exp_type, acmin, s)
+
+def done_points(filename):
+    done = set()
+    if os.path.exists(filename):
+        with open(filename) as f:
+            for row in f.readlines()[1:]:
+                exptype, cuetype, gamma, signal = row.split(',')[:4]
+                done.add(key(exptype, gamma, signal))
+    return done
+
+def run_point(point, seed):
+    # Returns the CSV rows of a grid point
+    exp_type, REPS, s, sigma, tmax, r, acmin = point
+    # Independent stream for each point, the same whatever the order
+    spawn_key = (zlib.crc32(repr(point).encode()),)
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key = spawn_key))
+    counts, rts = run_trials(exp_type, REPS, s, sigma, tmax, r, acmin, rng)
+    rows = []
+    for cue_type, rt in zip(CUE_TYPES, rts):
+        rows.append('%s,%s,%g,%g,%.4f,%.4f,%.4f' % ((exp_type, cue_type, acmin, s) +
+                                                    mean_confidence_interval(rt)))
+    return rows
+
+def sweep(points, seed, filename, workers = None):
+    done = done_points(filename)
+    points = [point for point in points if point_key(point) not in done]
+    with open(filename, 'a') as f:
+        if f.tell() == 0:
+            print(HEADER, file=f, flush=True)
+        with ProcessPoolExecutor(workers) as executor:
+            futures = {executor.submit(run_point, point, seed): point for point in points}
+            for i, future in enumerate(as_completed(futures)):
+                for row in future.result():
+                    print(row, file=f)
+                f.flush()
+                print('%s gamma=%g signal=%g finished (%d/%d)' % (point_key(futures[future]) +
+                                                                  (i + 1, len(points))), flush=True)
+
+if __name__ == '__main__':
+    try:
+        grid = sys.argv[1]
+        assert os.path.exists(grid)
+        output = sys.argv[2]
+        workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    except:
+        print("This script expects two required parameters and one optional parameter:")
+        print("  1. grid: file with the parameter grids")
+        print("  2. output: CSV file to which the results are appended")
+        print("  3. workers: number of parallel processes")
+        sys.exit(0)
+    points, seed = read_grid(grid)
+    sweep(points, seed, output, workers)
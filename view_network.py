@@ -15,31 +15,7 @@
 #You should have received a copy of the GNU General Public License
 #along with rtexp.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys, math
-
-def avg(l):
-    return sum(l) / float(len(l))
-
-def stdev(l, avg):
-    s = 0.0
-    for i in l:
-        s += (avg - i) ** 2
-    return math.sqrt(s / (len(l) - 1))
-
-def key(a):
-    if a is None:
-        return 2000
-    else:
-        return a
-
-def median(l):
-    if len(l) == 0:
-        return None
-    l.sort(key = key)
-    if len(l) % 2 == 0:
-        return avg((l[len(l) // 2 - 1], l[len(l) // 2]))
-    else:
-        return l[len(l) // 2]
+import numpy as np
 
 def n2rgb(n):
     if n >= 0:
@@ -52,7 +28,7 @@ def n2rgb(n):
         b = 255
     return "#{:02X}{:02X}{:02X}".format(r, g, b)
 
-import rtexp, ga, os, time
+import rtexp, aggregate
 
 input_neurons = ["left_target", "left_cue", "neutral_cue", "right_cue", "right_target"]
 hidden_neurons = ['hidden_%d' % (i + 1) for i in range(rtexp.HIDDEN_NEURONS)]
@@ -73,29 +49,17 @@ print('    { rank = same; ' + ';'.join(output_neurons) + ';}')
 #    print('];')
 
 g = rtexp.GENERATIONS
-weights = [[] for i in range(rtexp.NEURONS + rtexp.NEURONS ** 2)]
-for run_number in range(rtexp.RUNS):
-    arquivo = rtexp.ARQUIVO % (run_number, g)
-    if not os.path.exists(arquivo):
-        break
-    run = ga.Run.load(open(arquivo, 'rb'))
-    max_ind = None
-    max_fitness = 0
-    for pop in run:
-        for c in pop:
-            if c.fitness > max_fitness:
-                max_ind = c
-                max_fitness = c.fitness
-    for l, gene in zip(weights, max_ind):
-        l.append(gene)
+table = aggregate.load_table(rtexp.config)
+# Genes of the best individual of each run, one gene per row
+weights = table['best_genes'][table['best_g'] == g].T
 # Bias
 for n, l, w in zip(neurons, labels, weights[0:rtexp.NEURONS]):
-    v = avg(w)
+    v = np.mean(w)
     print("    %s [label=\"%s\",style=filled,color=\"%s\",shape=circle,width=.75, height=.5,fixedsize=true];" % (n, l, n2rgb(v)))
 i = rtexp.NEURONS
 for npre in neurons:
     for npost in neurons:
-        v = avg(weights[i])
+        v = np.mean(weights[i])
         print("    %s -> %s [color=\"%s\"" % (npre, npost, n2rgb(v)), end="")
         if neurons.index(npre) > neurons.index(npost):
             print(',constraint = false')